@@ -1,9 +1,31 @@
 import os
 import json
 import requests
+from requests.adapters import HTTPAdapter
 import re
+import hashlib
+import math
+import pickle
+import mmap
+import sqlite3
+import sys
+import multiprocessing
+import collections
+import functools
+import threading
+import queue
+import itertools
+import calendar
+import codecs
+import gzip
+import array
+import io
+import zipfile
+import tarfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html import escape, unescape
 from html.parser import HTMLParser
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit
 
 import argparse
 import time
@@ -90,15 +112,1228 @@ class EntryPoints:
 
 
 
-def download_file(url, out_file):
-    content = requests.get(url, stream=True).content
-    with open(out_file, "wb") as f:
-        f.write(content)
+def cache_validators(response):
+    """Extract the ETag/Last-Modified values of a response"""
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+
+
+class RawFileFetcher:
+    """Download raw files concurrently over a shared keep-alive session
+
+    Each download streams into a temporary file that is renamed into place
+    once complete, and is made conditional on the ETag/Last-Modified values
+    of the previous download. Failed attempts are retried with exponential
+    backoff, resuming a partially received body with an HTTP Range request.
+    """
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, timeout=60, retries=3, backoff=1.0, chunk_size=1 << 16):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def should_retry(self, error):
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code in self.RETRY_STATUS
+        return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+    def fetch(self, url, out_file, validators=None):
+        """Download url into out_file, returning a summary of the transfer"""
+        tic = Tic()
+        tmp_file = out_file + '.part'
+        state = {'bytes': 0, 'resume_from': None}
+        if os.path.exists(tmp_file):
+            # Left over from an earlier run; nothing tells us which version it holds
+            os.remove(tmp_file)
+
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    new_validators = self.fetch_once(url, out_file, tmp_file, validators, state)
+                    break
+                except requests.RequestException as e:
+                    if attempt == self.retries or not self.should_retry(e):
+                        raise
+                    time.sleep(self.backoff * 2 ** attempt)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+        return {
+            'url': url,
+            'modified': new_validators is not None,
+            'validators': new_validators,
+            'bytes': state['bytes'],
+            'elapsed': tic.toc(),
+        }
+
+    def fetch_once(self, url, out_file, tmp_file, validators, state):
+        """Make one download attempt, returning the new validators or None if not modified"""
+        headers = {}
+        offset = os.path.getsize(tmp_file) if os.path.exists(tmp_file) else 0
+        if offset and state['resume_from']:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = state['resume_from']
+        elif validators and os.path.exists(out_file):
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+
+            new_validators = cache_validators(response)
+            etag = new_validators['etag']
+            # Only a strong validator can make a later range request safe
+            state['resume_from'] = etag if etag and not etag.startswith('W/') else new_validators['last_modified']
+
+            # 206 continues the partial file, anything else is a complete body
+            mode = 'ab' if response.status_code == 206 else 'wb'
+            if mode == 'wb':
+                # A server that ignored the range sends the whole file again
+                state['bytes'] = 0
+            with open(tmp_file, mode) as f:
+                for chunk in response.iter_content(self.chunk_size):
+                    f.write(chunk)
+                    state['bytes'] += len(chunk)
+
+        os.replace(tmp_file, out_file)
+        return new_validators
+
+    def fetch_all(self, files):
+        """Fetch {name: (url, out_file, validators)} concurrently
+
+        Returns ({name: summary}, {name: error}); every fetch runs to
+        completion even if others fail.
+        """
+        results = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max(1, len(files))) as pool:
+            futures = {pool.submit(self.fetch, *args): name for name, args in files.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    errors[name] = e
+        return results, errors
+
+
+def format_transfer(summary):
+    """Describe a fetch summary as bytes, elapsed time and throughput"""
+    elapsed = summary['elapsed']
+    if not summary['modified']:
+        return f"not modified ({elapsed:0.2f} s)"
+    mb = summary['bytes'] / 1e6
+    rate = mb / elapsed if elapsed > 0 else 0.0
+    return f"{mb:0.2f} MB in {elapsed:0.2f} s ({rate:0.2f} MB/s)"
 
 def load_json(file="conf.json"):
     with open(file, encoding='utf8') as f:
         return json.load(f)
 
+def file_sha1(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+class JSONStreamReader:
+    """Incremental reader over a binary JSON file that tracks byte offsets
+
+    Positions are indices into a text buffer that is filled from the file on
+    demand and compacted as input is consumed, so memory use is bounded by
+    the largest value decoded rather than the size of the file.
+    """
+
+    def __init__(self, fh, chunk_size=1 << 20):
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.eof = False
+        # Buffer position and the file byte offset it corresponds to
+        self.mark = 0
+        self.mark_byte = 0
+
+    def fill(self):
+        chunk = self.fh.read(self.chunk_size)
+        self.eof = not chunk
+        self.buf += self.utf8.decode(chunk, final=self.eof)
+
+    def char(self, i):
+        """Character at position i, or '' at the end of the input"""
+        while i >= len(self.buf) and not self.eof:
+            self.fill()
+        return self.buf[i] if i < len(self.buf) else ''
+
+    def skip(self, i):
+        """Position of the next non-whitespace character from i"""
+        while True:
+            i = JSON_WHITESPACE.match(self.buf, i).end()
+            if i < len(self.buf) or self.eof:
+                return i
+            self.fill()
+
+    def expect(self, i, c):
+        if self.char(i) != c:
+            raise ValueError(f"Expected {c!r} at byte {self.offset(i)}")
+        return i + 1
+
+    def decode(self, i):
+        """Decode the JSON value at position i, returning (value, end)"""
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, i)
+                # A value ending with the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    return value, end
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def offset(self, i):
+        """Byte offset in the file of position i; positions must not decrease"""
+        self.mark_byte += len(self.buf[self.mark:i].encode('utf-8'))
+        self.mark = i
+        return self.mark_byte
+
+    def compact(self, i):
+        """Drop the consumed input before position i once enough has built up"""
+        if i < self.chunk_size:
+            return i
+        self.offset(i)
+        self.buf = self.buf[i:]
+        self.mark = 0
+        return 0
+
+
+def iter_array_items(fh, key):
+    """Yield (item, start, end) for each element of the array stored under key
+
+    fh is a binary file holding a JSON object; start and end are the byte
+    offsets of each element in the file.
+    """
+    reader = JSONStreamReader(fh)
+    i = reader.skip(reader.expect(reader.skip(0), '{'))
+    while reader.char(i) != '}':
+        name, i = reader.decode(i)
+        i = reader.skip(reader.expect(reader.skip(i), ':'))
+        if name == key and reader.char(i) == '[':
+            i = reader.skip(i + 1)
+            while reader.char(i) != ']':
+                item, end = reader.decode(i)
+                yield item, reader.offset(i), reader.offset(end)
+                i = reader.skip(end)
+                if reader.char(i) == ',':
+                    i = reader.skip(i + 1)
+                i = reader.compact(i)
+            i += 1
+        else:
+            _, i = reader.decode(i)
+        i = reader.skip(i)
+        if reader.char(i) == ',':
+            i = reader.skip(i + 1)
+
+def strip_bodies(item):
+    """Copy of a post or topic without the HTML bodies of it and its comments/replies"""
+    summary = {k: v for k, v in item.items() if k != 'body'}
+    for key in ('comments', 'posts'):
+        if key in item:
+            summary[key] = [{k: v for k, v in child.items() if k != 'body'} for child in item[key]]
+    return summary
+
+
+# Per-process state of a rendering worker, set once by _init_render_worker
+_render_state = {}
+
+def _init_render_worker(builder, method, link_map, base_url, writer):
+    """Receive the builder, the unified link map and a writer of its own once per worker process"""
+    # A forked worker inherits the parent's writer, whose threads it lacks
+    # and whose lock one of them may have held, so it is never used here;
+    # it is kept so that an open archive is never finalized here either
+    _render_state['parent_writer'] = builder.writer
+    builder.writer = writer
+    # Only send back what this worker does
+    builder.take_updates()
+    _render_state['builder'] = builder
+    _render_state['render'] = getattr(builder, method)
+    _render_state['link_map'] = link_map
+    _render_state['base_url'] = base_url
+
+def _render_worker(task):
+    index, item, path = task
+    written = write_output(_render_state['builder'].writer, path, _render_state['render'](item, _render_state['link_map'], _render_state['base_url']))
+    return index, written, _render_state['builder'].take_updates()
+
+# Layouts for --shard, by the number of subfolder levels they add
+SHARD_LAYOUTS = {'year': 1, 'month': 2}
+
+def shard_folder(sort_key, shard):
+    """Subfolders of its collection's folder an item goes in under a --shard layout, from its date's sort key"""
+    if shard is None or sort_key is None:
+        return ''
+    year, month = sort_key[:2]
+    if shard == 'year':
+        return f'{year}/'
+    return f'{year}/{month:02d}/'
+
+def item_page_root(shard):
+    """Prefix leading from an item's HTML page up to the site root"""
+    return '../' * (1 + SHARD_LAYOUTS.get(shard, 0))
+
+def page_name(name, number):
+    """Name of a page of a paginated item; the first page keeps the item's own name"""
+    if number == 1:
+        return name
+    return f'{name} - Page {number}'
+
+def reply_pages(replies, per_page):
+    """Split the replies of an item into pages of at most per_page replies"""
+    return [replies[i:i + per_page] for i in range(0, len(replies), per_page)] or [replies]
+
+def join_lines(lines):
+    """Yield lines separated by newlines, as '\\n'.join would, without holding them all"""
+    lines = iter(lines)
+    for line in lines:
+        yield line
+        break
+    for line in lines:
+        yield '\n'
+        yield line
+
+class ChunkStream:
+    """Chunks of one file passed from the renderer to a writer thread as they are produced
+
+    The queue between them is bounded, so the renderer waits when the writer
+    falls behind. The renderer ends the stream with end(), passing the error
+    if rendering failed, which the writer then raises instead of replacing
+    the file. A writer that fails discards the rest of the stream so that
+    the renderer never waits for it.
+    """
+    END = object()
+
+    def __init__(self, size):
+        self.queue = queue.Queue(maxsize=size)
+        self.discarding = False
+        self.ended = False
+
+    def put(self, chunk):
+        if not self.discarding:
+            self.queue.put(chunk)
+
+    def end(self, error=None):
+        self.queue.put(self.END if error is None else error)
+
+    def __iter__(self):
+        while not self.ended:
+            chunk = self.queue.get()
+            if chunk is self.END or isinstance(chunk, BaseException):
+                self.ended = True
+                if chunk is not self.END:
+                    raise chunk
+                return
+            yield chunk
+
+    def discard(self):
+        self.discarding = True
+        while not self.ended:
+            chunk = self.queue.get()
+            self.ended = chunk is self.END or isinstance(chunk, BaseException)
+
+
+class OutputWriter:
+    """Writes a builder's output files, leaving files whose content is unchanged alone
+
+    New content is hashed and compared with the file already on disk; only
+    changed files are written, through a temporary file renamed over the
+    old one, so a reader never sees a partly written file and unchanged
+    files keep their modification times.
+
+    Once start is called, text and bytes are handed to a bounded queue
+    drained by background threads, so rendering continues while earlier
+    files are written; the queue blocks the renderer when the threads fall
+    behind. Streams of chunks go through the same queue as ChunkStreams.
+    close waits for the queue and raises the first failed write.
+    """
+    # Whether files must be written in a reproducible order
+    ordered = False
+    # Whether files stay where they were written, for an incremental build to find
+    in_place = True
+    # Chunks of a stream a writer thread may fall behind the renderer by
+    STREAM_CHUNKS = 64
+    
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+        self.queue = None
+        self.threads = []
+        self.errors = {}
+        self.folders = set()
+    
+    def __reduce__(self):
+        # Locks, threads and open archives stay in this process; another
+        # process gets a fresh writer of the kind for_worker() makes
+        return type(self.for_worker()), ()
+    
+    def for_worker(self):
+        """A writer for a rendering worker process, whose take() this writer can merge"""
+        return OutputWriter()
+    
+    def destination(self, output_path):
+        """Where the files of output_path end up"""
+        return output_path
+    
+    def start(self, threads):
+        """Write in-memory content on threads background threads until close"""
+        if threads < 1 or self.threads:
+            return
+        self.queue = queue.Queue(maxsize=2 * threads)
+        self.threads = [threading.Thread(target=self.drain, daemon=True) for _ in range(threads)]
+        for thread in self.threads:
+            thread.start()
+    
+    def drain(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            path, content = task
+            try:
+                if isinstance(content, ChunkStream):
+                    self.write_chunks(path, content)
+                else:
+                    self.write_content(path, content)
+            except Exception as e:
+                if isinstance(content, ChunkStream):
+                    content.discard()
+                with self.lock:
+                    self.errors[path] = e
+    
+    def close(self):
+        """Wait for queued writes, raising the first error if any of them failed"""
+        if self.threads:
+            for _ in self.threads:
+                self.queue.put(None)
+            for thread in self.threads:
+                thread.join()
+            self.threads = []
+            self.queue = None
+        errors, self.errors = self.errors, {}
+        for path, error in errors.items():
+            print(f"{path}: failed ({error})")
+        if errors:
+            raise next(iter(errors.values()))
+    
+    def write(self, path, content):
+        """Write text, bytes or an iterable of text chunks to path
+
+        Chunks are written as the caller produces them, since producing them
+        is part of rendering: by a writer thread if there are any.
+        """
+        if self.queue is None:
+            if isinstance(content, (str, bytes)):
+                self.write_content(path, content)
+            else:
+                self.write_chunks(path, content)
+        elif isinstance(content, (str, bytes)):
+            self.queue.put((path, content))
+        else:
+            self.write_stream(path, content)
+    
+    def write_stream(self, path, chunks):
+        """Hand the chunks of a file to a writer thread as they are produced"""
+        stream = ChunkStream(self.STREAM_CHUNKS)
+        self.queue.put((path, stream))
+        try:
+            for chunk in chunks:
+                stream.put(chunk)
+        except BaseException as e:
+            stream.end(e)
+            raise
+        stream.end()
+    
+    def write_content(self, path, content):
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        digest = hashlib.sha1(data)
+        if self.unchanged(path, len(data), digest):
+            self.count('unchanged')
+            return
+        self.make_parent(path)
+        tmp_file = path + '.tmp'
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, path)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        self.count('written')
+    
+    def write_chunks(self, path, chunks):
+        # Streamed content is only known once written, so compare the temporary file
+        self.make_parent(path)
+        tmp_file = path + '.tmp'
+        digest = hashlib.sha1()
+        size = 0
+        try:
+            with open(tmp_file, 'wb') as f:
+                for chunk in chunks:
+                    data = chunk.encode('utf-8')
+                    digest.update(data)
+                    size += len(data)
+                    f.write(data)
+            changed = not self.unchanged(path, size, digest)
+            if changed:
+                os.replace(tmp_file, path)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        self.count('written' if changed else 'unchanged')
+    
+    def make_parent(self, path):
+        folder = os.path.dirname(path)
+        if folder not in self.folders:
+            os.makedirs(folder, exist_ok=True)
+            self.folders.add(folder)
+    
+    @staticmethod
+    def unchanged(path, size, digest):
+        try:
+            return os.path.getsize(path) == size and file_sha1(path) == digest.hexdigest()
+        except OSError:
+            return False
+    
+    def remove(self, path):
+        """Remove an output file that is no longer produced, if it exists"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        self.count('removed')
+    
+    def count(self, outcome):
+        with self.lock:
+            self.counts[outcome] += 1
+    
+    def take(self):
+        """Counts since the last call, for a worker to send back"""
+        with self.lock:
+            counts, self.counts = self.counts, collections.Counter()
+        return counts
+    
+    def merge(self, counts):
+        with self.lock:
+            self.counts.update(counts)
+    
+    def report(self):
+        counts = self.counts
+        return f"Wrote {counts['written']} files, left {counts['unchanged']} unchanged, removed {counts['removed']}"
+
+class MemoryWriter(OutputWriter):
+    """Keeps a builder's output files in memory instead of writing them
+
+    files maps each path, relative to root if one is given, to its text or
+    bytes. Rendering workers also use one to send the files they render back
+    to the parent's writer.
+    """
+    in_place = False
+    
+    def __init__(self, root=None):
+        super().__init__()
+        self.root = root
+        self.files = {}
+    
+    def for_worker(self):
+        return MemoryWriter()
+    
+    def destination(self, output_path):
+        return 'memory'
+    
+    def start(self, threads):
+        # Nothing to wait for
+        pass
+    
+    def write(self, path, content):
+        if not isinstance(content, (str, bytes)):
+            content = ''.join(content)
+        if self.root is not None:
+            path = os.path.relpath(path, self.root).replace(os.sep, '/')
+        self.files[path] = content
+        self.count('written')
+    
+    def remove(self, path):
+        if self.root is not None:
+            path = os.path.relpath(path, self.root).replace(os.sep, '/')
+        if self.files.pop(path, None) is not None:
+            self.count('removed')
+    
+    def take(self):
+        """Files written since the last call, for a worker to send back"""
+        files, self.files = self.files, {}
+        return files
+    
+    def merge(self, files):
+        for path, content in files.items():
+            self.write(path, content)
+
+
+class ArchiveWriter(OutputWriter):
+    """Writes a builder's output files into a zip or tar.gz archive instead of a directory
+
+    Entries are named by their path relative to root and get fixed
+    timestamps and permissions. They are added in the order they are
+    written, which rendering keeps deterministic for an ordered writer, so
+    the same build gives a byte-identical archive. The archive is written
+    to a temporary file renamed into place by close.
+    """
+    ordered = True
+    in_place = False
+    FORMATS = ('zip', 'tar.gz')
+    # The earliest time a zip entry can have
+    DATE_TIME = (1980, 1, 1, 0, 0, 0)
+    MTIME = calendar.timegm(DATE_TIME)
+    
+    def __init__(self, path, root, output_format='zip'):
+        super().__init__()
+        self.path = path
+        self.root = root
+        self.format = output_format
+        self.tmp_file = path + '.tmp'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if output_format == 'zip':
+            self.archive = zipfile.ZipFile(self.tmp_file, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            self.fileobj = open(self.tmp_file, 'wb')
+            self.gzip = gzip.GzipFile(filename='', mode='wb', fileobj=self.fileobj, mtime=0)
+            self.archive = tarfile.open(fileobj=self.gzip, mode='w', format=tarfile.PAX_FORMAT)
+    
+    def for_worker(self):
+        return MemoryWriter()
+    
+    def destination(self, output_path):
+        return self.path
+    
+    def start(self, threads):
+        # One thread keeps the entries in the order they were written
+        super().start(min(threads, 1))
+    
+    def write(self, path, content):
+        if not isinstance(content, (str, bytes)):
+            content = ''.join(content)
+        super().write(path, content)
+    
+    def write_content(self, path, content):
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        name = os.path.relpath(path, self.root).replace(os.sep, '/')
+        if self.format == 'zip':
+            info = zipfile.ZipInfo(name, date_time=self.DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self.archive.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = self.MTIME
+            info.mode = 0o644
+            self.archive.addfile(info, io.BytesIO(data))
+        self.count('written')
+    
+    def remove(self, path):
+        # A new archive has no stale files
+        pass
+    
+    def merge(self, files):
+        for path, content in files.items():
+            self.write(path, content)
+    
+    def close(self):
+        """Wait for queued entries and finish the archive, raising the first error if any failed"""
+        if self.archive is None:
+            return
+        try:
+            super().close()
+        finally:
+            self.archive.close()
+            if self.format != 'zip':
+                self.gzip.close()
+                self.fileobj.close()
+            self.archive = None
+        os.replace(self.tmp_file, self.path)
+
+def output_writer(output_format, output_path):
+    """The writer for --output_format: into output_path itself or an archive named after it"""
+    if output_format == 'dir':
+        return OutputWriter()
+    return ArchiveWriter(f'{output_path}.{output_format}', os.path.dirname(output_path), output_format)
+
+def write_output(writer, path, output):
+    """Write what a render method returned through writer, returning the paths produced
+
+    output is either the text of the file at path or a dict of the files
+    to write next to path, by name. A file's content is text, bytes, or an
+    iterable of text chunks written as they are produced. Files whose
+    content is unchanged are left as they are but still returned.
+    """
+    if isinstance(output, str):
+        output = {os.path.basename(path): output}
+    folder = os.path.dirname(path)
+    written = []
+    for name, content in output.items():
+        filepath = os.path.join(folder, name)
+        writer.write(filepath, content)
+        written.append(filepath)
+    return written
+
+def item_bodies(item):
+    """Yield the HTML bodies of a post or topic and of its comments/replies"""
+    if item.body:
+        yield item.body
+    for reply in item.replies:
+        if reply.body:
+            yield reply.body
+
+def item_weight(item):
+    """Estimate the rendering cost of a post or topic from the size of its HTML"""
+    return sum(len(body) for body in item_bodies(item))
+
+HREF_PATTERN = re.compile(r'''\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''', re.IGNORECASE)
+
+def extract_hrefs(item):
+    """Collect the distinct link targets in a post or topic and its comments/replies"""
+    hrefs = set()
+    for body in item_bodies(item):
+        for m in HREF_PATTERN.finditer(body):
+            hrefs.add(unescape(m.group(1) or m.group(2) or m.group(3) or ''))
+    hrefs.discard('')
+    return sorted(hrefs)
+
+def resolve_jobs(jobs):
+    """Number of worker processes to use; 0 or less means one per CPU core"""
+    if jobs is None:
+        return 1
+    if jobs <= 0:
+        return os.cpu_count() or 1
+    return jobs
+
+def render_items(builder, method, tasks, link_map, base_url, jobs=1, largest_first=True):
+    """Render (index, item, path) tasks with builder.<method> and write them, yielding (index, paths written)
+
+    With jobs > 1 the items are rendered and written in a process pool and
+    the link map is shipped to each worker once. If largest_first is set, all tasks are
+    collected and the largest items scheduled first, with results yielded in
+    completion order; otherwise tasks are consumed lazily with a bounded
+    number in flight, so streamed items are never all held in memory.
+    """
+    if jobs <= 1:
+        render = getattr(builder, method)
+        for i, item, path in tasks:
+            yield i, write_output(builder.writer, path, render(item, link_map, base_url))
+        return
+
+    initargs = (builder, method, link_map, base_url, builder.writer.for_worker())
+    if largest_first:
+        tasks = sorted(tasks, key=lambda task: item_weight(task[1]), reverse=True)
+        if not tasks:
+            return
+        with multiprocessing.Pool(min(jobs, len(tasks)), _init_render_worker, initargs) as pool:
+            yield from merge_worker_results(builder, pool.imap_unordered(_render_worker, tasks))
+        return
+
+    with multiprocessing.Pool(jobs, _init_render_worker, initargs) as pool:
+        yield from merge_worker_results(builder, bounded_map(pool, _render_worker, tasks, 4 * jobs))
+
+def bounded_map(pool, func, tasks, window):
+    """Like pool.imap, but with at most window tasks taken from tasks and not yet returned"""
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def merge_worker_results(builder, results):
+    """Merge the updates workers send back into the builder, yielding (index, paths written)"""
+    for i, written, updates in results:
+        builder.merge_updates(updates)
+        yield i, written
+
+def render_to_files(builder, method, items, paths, link_map, base_url, jobs=1, collection=None):
+    """Render each item to its output path, returning the number of files written
+
+    items may be a list or, for streamed raw files, an iterator; paths must
+    be a list. When several items map to the same path the last one wins, as
+    it would when writing them one after another, so only that one is
+    rendered. If the builder has a manifest, items it considers up to date
+    are skipped.
+    """
+    last_writer = {path: i for i, path in enumerate(paths)}
+    keep = set(last_writer.values())
+    tasks = ((i, item) for i, item in enumerate(items) if i in keep)
+    if builder.manifest is not None:
+        tasks = builder.manifest.select(builder, collection, tasks, paths, link_map, base_url)
+    tasks = ((i, item, paths[i]) for i, item in tasks)
+
+    written = 0
+    largest_first = isinstance(items, list) and not builder.writer.ordered
+    for i, files in render_items(builder, method, tasks, link_map, base_url, jobs, largest_first):
+        if builder.manifest is not None:
+            builder.manifest.record(i, files)
+        written += len(files)
+    return written
+
+
+class BuildManifest:
+    """Per-item record of a build, used to re-render only what changed
+
+    The manifest is stored next to the output directory. For every item
+    written it records a hash of the item's fields, the output path, every
+    file written for it and the targets the item's links resolved to, along
+    with a version hash of the unified link map and the settings that
+    affect rendering.
+    """
+    FORMAT_VERSION = 6
+
+    def __init__(self, output_path, incremental=False, settings=None):
+        self.output_path = output_path
+        self.path = os.path.normpath(output_path) + '.manifest.json'
+        self.incremental = incremental
+        self.settings = settings or {}
+        self.previous = {}
+        self.previous_map_version = None
+        self.previous_settings = None
+        self.entries = {}
+        # Keys of the selected items whose files are not yet recorded, by task index
+        self.pending = {}
+        self.map_version = None
+        self.rendered = 0
+        self.skipped = 0
+        self.removed = 0
+
+        # A manifest that can't be read is treated as absent, so the next build is a full one
+        try:
+            data = load_json(self.path)
+            if data.get('format') == self.FORMAT_VERSION:
+                self.previous = data['items']
+                self.previous_map_version = data['map_version']
+                self.previous_settings = data['settings']
+        except (OSError, ValueError, KeyError, AttributeError):
+            self.previous = {}
+            self.previous_map_version = None
+            self.previous_settings = None
+
+    def hash_item(self, item, base_url):
+        """Hash the fields of an item"""
+        source = '\0'.join(item.fields())
+        return hashlib.sha1(f'{base_url}\0{source}'.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def hash_link_map(self, link_map):
+        """Hash the unified link map to give it a version"""
+        source = json.dumps(link_map, sort_keys=True, check_circular=False)
+        return hashlib.sha1(source.encode('ascii')).hexdigest()
+
+    def links_changed(self, builder, entry, link_map):
+        """Check whether any link of a previously built item now resolves differently"""
+        if self.map_version == self.previous_map_version:
+            return False
+        return any(builder.link_target(href, link_map) != target for href, target in entry['links'].items())
+
+    def select(self, builder, collection, tasks, paths, link_map, base_url):
+        """Record the items of (index, item) tasks, passing on those that need rendering"""
+        if self.map_version is None:
+            self.map_version = self.hash_link_map(link_map)
+        reuse = self.incremental and self.settings == self.previous_settings
+        self.pending = {}
+
+        for i, item in tasks:
+            key = f"{collection}/{item.url}"
+            digest = self.hash_item(item, base_url)
+            path = os.path.relpath(paths[i], self.output_path)
+            old = self.previous.get(key)
+
+            if (reuse and old is not None and old['hash'] == digest and old['path'] == path
+                    and all(os.path.exists(os.path.join(self.output_path, p)) for p in old['files'])
+                    and not self.links_changed(builder, old, link_map)):
+                self.entries[key] = old
+                self.skipped += 1
+                builder.item_unchanged(item, link_map)
+                continue
+
+            links = {href: builder.link_target(href, link_map) for href in extract_hrefs(item)}
+            self.entries[key] = {'hash': digest, 'path': path, 'files': [path], 'links': links}
+            self.pending[i] = key
+            self.rendered += 1
+            yield i, item
+
+    def record(self, i, files):
+        """Record the files written for the item of task i"""
+        self.entries[self.pending.pop(i)]['files'] = [os.path.relpath(f, self.output_path) for f in files]
+
+    def save(self, writer):
+        """Remove outputs whose source items are gone through writer and write the manifest"""
+        current = {path for entry in self.entries.values() for path in entry['files']}
+        for path in {path for entry in self.previous.values() for path in entry['files']} - current:
+            filepath = os.path.join(self.output_path, path)
+            if os.path.exists(filepath):
+                writer.remove(filepath)
+                self.removed += 1
+
+        if (self.entries != self.previous or self.map_version != self.previous_map_version
+                or self.settings != self.previous_settings):
+            data = {
+                'format': self.FORMAT_VERSION,
+                'map_version': self.map_version,
+                'settings': self.settings,
+                'items': self.entries,
+            }
+            tmp_file = self.path + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(data, ensure_ascii=False))
+            os.replace(tmp_file, self.path)
+
+        print(f"Rendered {self.rendered} items, skipped {self.skipped} unchanged, removed {self.removed} stale files")
+
+
+# Kinds of node in a parsed body
+START, END, DATA = 0, 1, 2
+
+@functools.lru_cache(maxsize=1 << 16)
+def link_netloc(href):
+    """Network location of a link target, or None if it cannot be parsed"""
+    try:
+        return urlparse(href).netloc
+    except ValueError:
+        return None
+
+
+def start_node(tag, attrs):
+    """Node for a start tag, with the netloc of the href for links"""
+    if tag == 'a':
+        href = dict(attrs).get('href')
+        return (START, tag, attrs, link_netloc(href) if href else None)
+    return (START, tag, attrs)
+
+
+class BodyParser(HTMLParser):
+    """Parse an HTML body into a flat list of nodes for the renderers
+
+    Nodes are (START, tag, attrs), (END, tag) and (DATA, text), in the order
+    HTMLParser reports them. Link start tags carry a fourth element, the
+    network location of their href (None if it cannot be parsed), so that
+    the renderers can classify links without parsing their URLs again.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.nodes = []
+
+    def handle_starttag(self, tag, attrs):
+        self.nodes.append(start_node(tag, tuple(attrs)))
+
+    def handle_endtag(self, tag):
+        self.nodes.append((END, tag))
+
+    def handle_data(self, data):
+        self.nodes.append((DATA, data))
+
+
+# Functions parsing an HTML body into nodes, selected with --parser
+BODY_PARSERS = {}
+
+def body_parser(name):
+    """Register a function parsing an HTML body into nodes under name"""
+    def register(parse):
+        BODY_PARSERS[name] = parse
+        return parse
+    return register
+
+@body_parser('htmlparser')
+def parse_body(html):
+    """Parse an HTML body into a tuple of nodes (see BodyParser)
+
+    This is the reference parser: its nodes are exactly the calls
+    HTMLParser makes, so other parsers must give the same nodes.
+    """
+    parser = BodyParser()
+    parser.feed(html)
+    return tuple(parser.nodes)
+
+
+# The markup tokenize_body handles itself: comments, end tags, and start tags
+# with simple names and attributes, where HTMLParser's tolerant matching
+# agrees with the strict one. Any other '<' leaves the body to parse_body.
+MARKUP = r'''
+    <!--.*?--\s*>
+  | </[a-zA-Z][a-zA-Z0-9]*[ \t\n\r\f]*>
+  | <[a-zA-Z][a-zA-Z0-9]*
+     (?:[ \t\n\r\f]+[a-zA-Z_:][-a-zA-Z0-9_:.]*
+        (?:[ \t\n\r\f]*=[ \t\n\r\f]*(?:"[^"]*"|'[^']*'|[^\s"'=<>`/]+(?!/)))?)*
+     [ \t\n\r\f]*/?>
+'''
+TOKEN_PATTERN = re.compile(rf'([^<]+)|({MARKUP})|<', re.VERBOSE | re.DOTALL)
+TAG_PATTERN = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)(.*?)/?>\Z', re.DOTALL)
+ATTR_PATTERN = re.compile(r'''([a-zA-Z_:][-a-zA-Z0-9_:.]*)(?:[ \t\n\r\f]*=[ \t\n\r\f]*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`/]+)))?''')
+# Elements whose content HTMLParser does not parse as markup
+CDATA_TAGS = ('script', 'style')
+TAIL_END = re.compile(r'[\s;]')
+
+@functools.lru_cache(maxsize=1 << 16)
+def markup_nodes(markup):
+    """Nodes for a piece of markup matched by MARKUP, or None if only HTMLParser can handle it
+
+    The same tags recur throughout the archive, so their nodes are cached.
+    """
+    if markup.startswith('<!--'):
+        return ()
+    slash, tag, attrs_text = TAG_PATTERN.match(markup).groups()
+    tag = tag.lower()
+    if slash:
+        return ((END, tag),)
+    if tag in CDATA_TAGS:
+        return None
+    
+    attrs = []
+    for match in ATTR_PATTERN.finditer(attrs_text):
+        name, double_quoted, single_quoted, bare = match.groups()
+        value = double_quoted if double_quoted is not None else single_quoted if single_quoted is not None else bare
+        if value:
+            value = unescape(value)
+        attrs.append((name.lower(), value))
+    
+    node = start_node(tag, tuple(attrs))
+    if markup.endswith('/>'):
+        return (node, (END, tag))
+    return (node,)
+
+@body_parser('tokenizer')
+def tokenize_body(html):
+    """Parse an HTML body into the same nodes as parse_body, but faster
+
+    The bodies in the archive use a small set of plain tags, which a single
+    regular expression can tokenize. Bodies with any other markup are
+    handed to parse_body.
+    """
+    nodes = []
+    n = len(html)
+    for match in TOKEN_PATTERN.finditer(html):
+        kind = match.lastindex
+        if kind == 1:
+            text = match.group()
+            if match.end() == n:
+                # Without close(), HTMLParser holds back trailing text that
+                # may end in a partial character reference
+                amppos = text.rfind('&', max(0, len(text) - 34))
+                if amppos >= 0 and not TAIL_END.search(text, amppos):
+                    break
+            nodes.append((DATA, unescape(text) if '&' in text else text))
+        elif kind == 2:
+            markup = markup_nodes(match.group())
+            if markup is None:
+                return parse_body(html)
+            nodes.extend(markup)
+        else:
+            return parse_body(html)
+    return tuple(nodes)
+
+
+def rewrite_href(href, url_map, rewritten, untouched):
+    """The local target of an href, or None to leave it alone; records which it was"""
+    target = url_map.get(href) if link_netloc(href) is not None else None
+    if target is None:
+        untouched.append(href)
+    else:
+        rewritten.append(href)
+    return target
+
+def rewrite_links(html, url_map):
+    """Point the internal links of an HTML body at local pages
+
+    Only the values of href attributes are replaced; everything else is
+    copied through from the original. Anchors are found among the markup
+    tokenize_body matches, so they are exactly the start tags HTMLParser
+    sees; bodies with markup only HTMLParser handles (including script and
+    style elements) go to AnchorRewriter. Returns the new HTML and lists of
+    the hrefs that were rewritten and of those that were left alone.
+    """
+    output = []
+    rewritten = []
+    untouched = []
+    pos = 0
+    for match in TOKEN_PATTERN.finditer(html):
+        kind = match.lastindex
+        if kind == 1:
+            continue
+        if kind is None:
+            return AnchorRewriter(url_map).rewrite(html)
+        if match.group().startswith('<!--'):
+            continue
+        tag = TAG_PATTERN.match(html, match.start(), match.end())
+        if tag.group(1):
+            continue
+        name = tag.group(2).lower()
+        if name in CDATA_TAGS:
+            return AnchorRewriter(url_map).rewrite(html)
+        if name != 'a':
+            continue
+        
+        # As with HTMLParser, the last href attribute wins
+        value = None
+        for attr in ATTR_PATTERN.finditer(html, tag.start(3), tag.end(3)):
+            if attr.group(1).lower() == 'href':
+                value = attr
+        if value is None or value.lastindex == 1 or not value.group(value.lastindex):
+            continue
+        target = rewrite_href(unescape(value.group(value.lastindex)), url_map, rewritten, untouched)
+        if target is None:
+            continue
+        
+        start, end = value.span(value.lastindex)
+        replacement = escape(target)
+        if value.lastindex == BARE_VALUE:
+            replacement = f'"{replacement}"'
+        output.append(html[pos:start])
+        output.append(replacement)
+        pos = end
+    
+    if not rewritten:
+        return html, rewritten, untouched
+    output.append(html[pos:])
+    return ''.join(output), rewritten, untouched
+
+# Group of ATTR_PATTERN holding an unquoted value
+BARE_VALUE = 4
+
+
+class AnchorRewriter(HTMLParser):
+    """rewrite_links for bodies with markup only HTMLParser handles
+
+    An anchor whose href is rewritten gets its start tag rebuilt from the
+    attributes HTMLParser reports; the rest of the body is copied through.
+    """
+
+    def __init__(self, url_map):
+        super().__init__()
+        self.url_map = url_map
+        self.rewritten = []
+        self.untouched = []
+        self.replacements = []
+
+    def rewrite(self, html):
+        self.line_starts = [0] + [m.end() for m in re.finditer('\n', html)]
+        self.feed(html)
+        if not self.replacements:
+            return html, self.rewritten, self.untouched
+        output = []
+        pos = 0
+        for start, end, tag in self.replacements:
+            output.append(html[pos:start])
+            output.append(tag)
+            pos = end
+        output.append(html[pos:])
+        return ''.join(output), self.rewritten, self.untouched
+
+    def handle_starttag(self, tag, attrs, close='>'):
+        if tag != 'a':
+            return
+        # As with the nodes, the last href attribute wins
+        hrefs = [i for i, (name, _) in enumerate(attrs) if name == 'href']
+        if not hrefs or not attrs[hrefs[-1]][1]:
+            return
+        i = hrefs[-1]
+        target = rewrite_href(attrs[i][1], self.url_map, self.rewritten, self.untouched)
+        if target is None:
+            return
+        attrs = attrs[:i] + [('href', target)] + attrs[i + 1:]
+        line, offset = self.getpos()
+        start = self.line_starts[line - 1] + offset
+        text = ''.join(f' {name}' if value is None else f' {name}="{escape(value)}"' for name, value in attrs)
+        self.replacements.append((start, start + len(self.get_starttag_text()), f'<a{text}{close}'))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, '/>')
+
+
+class BodyCache:
+    """Parsed bodies (see parse_body) keyed by a hash of their HTML
+
+    One cache can be shared by several builders so that each body is parsed
+    once per build, and it is saved to disk so that later builds only parse
+    bodies that changed. A saved cache only holds the nodes of the parser
+    named in its header, and only the bodies looked up or kept by the build
+    that saved it. Process pool workers send back the entries they add and the
+    keys they use to be merged into the main process's cache.
+    """
+    MAGIC = b'markforster-body-cache 2 '
+
+    def __init__(self, path=None, parser='tokenizer'):
+        self.path = path
+        self.header = self.MAGIC + parser.encode('utf-8') + b'\n'
+        self.entries = {}
+        self.added = {}
+        self.used = set()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    if f.readline() == self.header:
+                        self.entries = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                self.entries = {}
+
+    def nodes(self, html, parse=parse_body):
+        """Parsed form of an HTML body, parsing it with parse only if it is not cached yet"""
+        key = hashlib.sha1(html.encode('utf-8')).digest()
+        self.used.add(key)
+        nodes = self.entries.get(key)
+        if nodes is None:
+            nodes = parse(html)
+            self.entries[key] = self.added[key] = nodes
+        return nodes
+
+    def keep(self, html):
+        """Keep the entry of a body in the saved cache without looking it up"""
+        self.used.add(hashlib.sha1(html.encode('utf-8')).digest())
+
+    def take_added(self):
+        """Return and forget the entries added and the keys used since the last call"""
+        added, self.added = self.added, {}
+        used, self.used = self.used, set()
+        return added, used
+
+    def merge(self, updates):
+        added, used = updates
+        self.entries.update(added)
+        self.added.update(added)
+        self.used.update(used)
+
+    def save(self):
+        """Write the entries used by this build if any were added or are no longer used"""
+        if not self.path or (not self.added and self.used.issuperset(self.entries)):
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(self.header)
+            pickle.dump({key: self.entries[key] for key in self.used if key in self.entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.path)
+        self.added = {}
+
 
 class HTML2MarkdownParser(HTMLParser):
     """Convert HTML to Markdown with wiki-link support for internal links"""
@@ -114,8 +1349,6 @@ class HTML2MarkdownParser(HTMLParser):
         self.in_code = False
         
     def handle_starttag(self, tag, attrs):
-        attrs_dict = dict(attrs)
-        
         if tag == 'p':
             self.markdown.append('\n\n')
         elif tag == 'br':
@@ -134,8 +1367,8 @@ class HTML2MarkdownParser(HTMLParser):
             self.markdown.append('\n```\n')
             self.in_pre = True
         elif tag == 'a':
-            href = attrs_dict.get('href', '')
-            self.tag_stack.append(('link', href))
+            href = dict(attrs).get('href', '')
+            self.tag_stack.append(('link', href, link_netloc(href) if href else None))
         elif tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
             level = int(tag[1])
             self.markdown.append('\n' + '#' * level + ' ')
@@ -166,29 +1399,23 @@ class HTML2MarkdownParser(HTMLParser):
             self.in_pre = False
         elif tag == 'a':
             if self.tag_stack and isinstance(self.tag_stack[-1], tuple) and self.tag_stack[-1][0] == 'link':
-                _, href = self.tag_stack.pop()
+                _, href, netloc = self.tag_stack.pop()
                 link_text = self.markdown.pop() if self.markdown else ''
                 
                 # Skip empty or None hrefs
                 if not href:
                     self.markdown.append(link_text)
+                elif netloc is None:
+                    # If URL parsing fails, just output as plain text with the href
+                    self.markdown.append(f'{link_text} ({href})')
                 else:
-                    try:
-                        # Check if it's an internal link
-                        if self.is_internal_link(href):
-                            # Convert to wiki link
-                            target_id = self.get_post_id_from_url(href)
-                            if target_id:
-                                self.markdown.append(f'[[{target_id}|{link_text}]]')
-                            else:
-                                # Fallback to regular link if we can't find the post
-                                self.markdown.append(f'[{link_text}]({href})')
-                        else:
-                            # External link - keep as is
-                            self.markdown.append(f'[{link_text}]({href})')
-                    except (ValueError, Exception):
-                        # If URL parsing fails, just output as plain text with the href
-                        self.markdown.append(f'{link_text} ({href})')
+                    # Links to archived items become wiki links
+                    target_id = self.get_post_id_from_url(href)
+                    if target_id:
+                        self.markdown.append(f'[[{target_id}|{link_text}]]')
+                    else:
+                        # External link or unknown post - keep as is
+                        self.markdown.append(f'[{link_text}]({href})')
         elif tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
             if self.tag_stack and self.tag_stack[-1] == 'header':
                 self.tag_stack.pop()
@@ -211,11 +1438,23 @@ class HTML2MarkdownParser(HTMLParser):
             else:
                 self.markdown.append(data)
     
-    def is_internal_link(self, url):
-        """Check if URL is internal to the blog"""
-        parsed = urlparse(url)
-        base_parsed = urlparse(self.base_url)
-        return parsed.netloc == base_parsed.netloc or not parsed.netloc
+    def feed_nodes(self, nodes):
+        """Convert a body already parsed by parse_body instead of feeding HTML"""
+        handle_data = self.handle_data
+        handle_starttag = self.handle_starttag
+        handle_endtag = self.handle_endtag
+        for node in nodes:
+            kind = node[0]
+            if kind == DATA:
+                handle_data(node[1])
+            elif kind == END:
+                handle_endtag(node[1])
+            elif node[1] == 'a':
+                # Reuse the href's netloc from parsing
+                href = dict(node[2]).get('href', '')
+                self.tag_stack.append(('link', href, node[3]))
+            else:
+                handle_starttag(node[1], node[2])
     
     def get_post_id_from_url(self, url):
         """Get post ID from URL using the post_id_map"""
@@ -227,7 +1466,8 @@ class HTML2MarkdownParser(HTMLParser):
         """Return the final markdown"""
         result = ''.join(self.markdown)
         # Clean up multiple newlines
-        result = re.sub(r'\n{3,}', '\n\n', result)
+        if '\n\n\n' in result:
+            result = re.sub(r'\n{3,}', '\n\n', result)
         return result.strip()
 
 
@@ -241,11 +1481,18 @@ class ObsidianVaultBuilder:
         self.blog_path = os.path.join(self.vault_path, 'Blog')
         self.fvp_forum_path = os.path.join(self.vault_path, 'FVP Forum')
         self.general_forum_path = os.path.join(self.vault_path, 'General Forum')
-        os.makedirs(self.blog_path, exist_ok=True)
-        os.makedirs(self.fvp_forum_path, exist_ok=True)
-        os.makedirs(self.general_forum_path, exist_ok=True)
+        self.manifest = None
+        # Creates folders as files are written into them; replaced to write elsewhere
+        self.writer = OutputWriter()
+        self.body_cache = None
+        self.body_parser = tokenize_body
+        # Posts per note of a long forum topic; set from --replies_per_page
+        self.replies_per_page = 100
+        # Date subfolders items go in, 'year' or 'month'; set from --shard
+        self.shard = None
     
-    def sanitize_filename(self, title):
+    @staticmethod
+    def sanitize_filename(title):
         """Create a safe filename from a title"""
         # Replace non-breaking spaces with regular spaces
         safe = title.replace('\xa0', ' ')
@@ -257,15 +1504,19 @@ class ObsidianVaultBuilder:
             safe = safe[:200]
         return safe
     
+    def item_name(self, item):
+        """Name of an item's note within its collection's folder, in its date subfolders if sharded"""
+        return shard_folder(item.sort_key, self.shard) + item.slug
+    
     def build_post_id_map(self, posts, subfolder=None):
         """Build a mapping of URLs to post filenames (without .md extension)"""
         post_map = {}
         for post in posts:
             # Map URL to the sanitized filename (with subfolder if provided)
-            filename = self.sanitize_filename(post['title'])
+            filename = self.item_name(post)
             if subfolder:
                 filename = f"{subfolder}/{filename}"
-            post_map[post['url']] = filename
+            post_map[post.url] = filename
         return post_map
     
     def build_topic_id_map(self, topics, subfolder=None):
@@ -273,10 +1524,10 @@ class ObsidianVaultBuilder:
         topic_map = {}
         for topic in topics:
             # Map URL to the sanitized filename (with subfolder if provided)
-            filename = self.sanitize_filename(topic['title'])
+            filename = self.item_name(topic)
             if subfolder:
                 filename = f"{subfolder}/{filename}"
-            topic_map[topic['url']] = filename
+            topic_map[topic.url] = filename
         return topic_map
     
     def build_unified_id_map(self, blog_data, fvp_forum_data, general_forum_data):
@@ -294,50 +1545,68 @@ class ObsidianVaultBuilder:
         
         return unified_map
     
+    def parse_body(self, html):
+        """Parse an HTML body into nodes, through the shared cache if there is one"""
+        if self.body_cache is not None:
+            return self.body_cache.nodes(html, self.body_parser)
+        return self.body_parser(html)
+    
+    def item_unchanged(self, item, unified_id_map):
+        """The manifest skipped rendering an item; its cached bodies are kept for later builds"""
+        if self.body_cache is not None:
+            for body in item_bodies(item):
+                self.body_cache.keep(body)
+    
+    def take_updates(self):
+        """Bodies parsed and write counts since the last call, for a worker to send back"""
+        parsed = self.body_cache.take_added() if self.body_cache is not None else None
+        return parsed, self.writer.take()
+    
+    def merge_updates(self, updates):
+        parsed, writes = updates
+        if parsed is not None:
+            self.body_cache.merge(parsed)
+        self.writer.merge(writes)
+    
     def html_to_markdown(self, html, base_url, post_id_map):
         """Convert HTML to Markdown"""
         parser = HTML2MarkdownParser(base_url, post_id_map)
-        parser.feed(html)
+        parser.feed_nodes(self.parse_body(html))
         return parser.get_markdown()
     
+    def link_target(self, href, post_id_map):
+        """Look up the note a link points to, as HTML2MarkdownParser does"""
+        return post_id_map.get(href.strip())
+    
     def format_date(self, date_obj):
         """Format date object to readable string"""
-        return f"{date_obj['year']}-{date_obj['month']}-{date_obj['day']} {date_obj.get('time', '00:00')}"
+        return format_date(date_obj)
 
-    def create_blog_index(self, posts):
+    def create_blog_index(self, view):
         """Create an index file listing all blog posts in reverse chronological order"""
         md = []
         
         md.append('# Blog Archive')
         md.append('')
-        md.append(f'Total posts: {len(posts)}')
+        md.append(f'Total posts: {len(view.items)}')
         md.append('')
         
-        # Sort posts by date (reverse chronological)
-        sorted_posts = sorted(posts, key=lambda p: (
-            int(p['date']['year']),
-            int(p['date']['month']),
-            int(p['date']['day']),
-            p['date'].get('time', '00:00')
-        ), reverse=True)
-        
-        for post in sorted_posts:
-            filename = self.sanitize_filename(post['title'])
-            date_str = self.format_date(post['date'])
+        for post in view.by_date:
+            filename = self.item_name(post)
+            date_str = post.date
             
             # Create entry with wiki link
-            md.append(f"- [[Blog/{filename}|{post['title']}]] - *{date_str}*")
+            md.append(f"- [[Blog/{filename}|{post.title}]] - *{date_str}*")
             
             # Add tags if present
-            if post.get('tags'):
-                md.append(f"  - Tags: {', '.join(['#'+self.sanitize_tag(t) for t in post['tags']])}")
+            if post.tags:
+                md.append(f"  - Tags: {', '.join(['#'+self.sanitize_tag(t) for t in post.tags])}")
         
         # Write index file
         index_path = os.path.join(self.vault_path, 'Blog Archive.md')
-        with open(index_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(md))
+        self.writer.write(index_path, '\n'.join(md))
         
-        print(f"Created blog archive index at {index_path}")
+        print(f"Created blog archive index at {self.writer.destination(index_path)}")
     
     def sanitize_tag(self, tag):
         safe = re.sub(r'[ ]', '', tag)
@@ -349,210 +1618,405 @@ class ObsidianVaultBuilder:
         
         # Frontmatter
         md.append('---')
-        md.append(f"id: {post['id']}")
-        md.append(f"title: \"{post['title']}\"")
-        md.append(f"date: {self.format_date(post['date'])}")
-        md.append(f"url: {post['url']}")
-        if post.get('tags'):
-            md.append(f"tags: [{', '.join([self.sanitize_tag(t) for t in post['tags']])}]")
+        md.append(f"id: {post.id}")
+        md.append(f"title: \"{post.title}\"")
+        md.append(f"date: {post.date}")
+        md.append(f"url: {post.url}")
+        if post.tags:
+            md.append(f"tags: [{', '.join([self.sanitize_tag(t) for t in post.tags])}]")
         md.append('---')
         md.append('')
         
         # Title
-        md.append(f"# {post['title']}")
+        md.append(f"# {post.title}")
         md.append('')
         
         # Date
-        md.append(f"*Posted: {self.format_date(post['date'])}*")
+        md.append(f"*Posted: {post.date}*")
         md.append('')
         
         # Body
-        body_md = self.html_to_markdown(post['body'], base_url, post_id_map)
+        body_md = self.html_to_markdown(post.body, base_url, post_id_map)
         md.append(body_md)
         md.append('')
         
         # Comments
-        if post.get('comments'):
+        if post.replies:
             md.append('---')
             md.append('')
-            md.append(f"## Comments ({len(post['comments'])})")
+            md.append(f"## Comments ({len(post.replies)})")
             md.append('')
             
-            for comment in post['comments']:
-                md.append(f"### {comment['author']} - {self.format_date(comment['date'])}")
+            for comment in post.replies:
+                md.append(f"### {comment.author} - {comment.date}")
                 md.append('')
-                md.append(self.html_to_markdown(comment['body'], base_url, post_id_map))
+                md.append(self.html_to_markdown(comment.body, base_url, post_id_map))
                 md.append('')
         
         return '\n'.join(md)
     
-    def build_blog_vault(self, blog_data, unified_id_map):
+    def build_blog_vault(self, blog_data, unified_id_map, jobs=1, view=None):
         """Build vault from blog posts"""
         posts = blog_data['posts']
-        base_url = posts[0]['url'] if posts else 'http://markforster.squarespace.com'
+        base_url = posts[0].url if posts else 'http://markforster.squarespace.com'
         
-        for post in posts:
-            # Create filename from title
-            filename = self.sanitize_filename(post['title']) + '.md'
-            filepath = os.path.join(self.blog_path, filename)
-            
-            # Generate markdown
-            markdown = self.build_blog_post(post, unified_id_map, base_url)
-            
-            # Write file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(markdown)
+        # Create filenames from titles
+        filepaths = [os.path.join(self.blog_path, self.item_name(post) + '.md') for post in posts]
+        
+        # Generate markdown and write files
+        render_to_files(self, 'build_blog_post', full_items(blog_data, 'posts'), filepaths, unified_id_map, base_url, jobs, 'Blog')
         
         # Create blog archive index
-        self.create_blog_index(posts)
-        print(f"Created {len(posts)} blog post files in {self.blog_path}")
-    
-    def get_latest_post_date(self, topic):
-        """Get the date of the most recent post in a topic"""
-        if not topic.get('posts'):
-            # Fallback to topic creation date if no posts
-            return (
-                int(topic['date']['year']),
-                int(topic['date']['month']),
-                int(topic['date']['day']),
-                topic['date'].get('time', '00:00')
-            )
-        
-        # Get the last post's date (posts should be in chronological order)
-        last_post = topic['posts'][-1]
-        return (
-            int(last_post['date']['year']),
-            int(last_post['date']['month']),
-            int(last_post['date']['day']),
-            last_post['date'].get('time', '00:00')
-        )
+        self.create_blog_index(view or CollectionView(blog_data, 'posts'))
+        print(f"Created {len(posts)} blog post files in {self.writer.destination(self.blog_path)}")
     
     def build_forum_topic(self, topic, topic_id_map, base_url):
-        """Convert a single forum topic to markdown"""
-        md = []
+        """Convert a single forum topic to markdown
         
-        # Frontmatter
-        md.append('---')
-        md.append(f"id: {topic['id']}")
-        md.append(f"title: \"{topic['title']}\"")
-        md.append(f"date: {self.format_date(topic['date'])}")
-        md.append(f"author: {topic['author']}")
-        md.append(f"url: {topic['url']}")
-        if topic.get('tags'):
-            md.append(f"tags: [{', '.join([self.sanitize_tag(t) for t in topic['tags']])}]")
-        md.append('---')
-        md.append('')
+        Returns the pages of the topic by file name, replies_per_page posts
+        each, as streams of text to be written as they are produced.
+        """
+        pages = reply_pages(topic.replies, self.replies_per_page)
+        return {page_name(topic.slug, number) + '.md': join_lines(self.forum_topic_lines(topic, pages, number, topic_id_map, base_url))
+                for number in range(1, len(pages) + 1)}
+    
+    def topic_page_nav(self, name, number, count):
+        """Links from a page of a long topic to its neighbours and to every page, name being the topic's link target"""
+        links = []
+        if number > 1:
+            links.append(f"[[{page_name(name, number - 1)}|← Previous]]")
+        links.append('Pages: ' + ' '.join(str(n) if n == number else f"[[{page_name(name, n)}|{n}]]" for n in range(1, count + 1)))
+        if number < count:
+            links.append(f"[[{page_name(name, number + 1)}|Next →]]")
+        return ' | '.join(links)
+    
+    def forum_topic_lines(self, topic, pages, number, topic_id_map, base_url):
+        """Yield the markdown lines of one page of a forum topic"""
+        # Page links go through the forum folder, as other links to the topic do,
+        # so that same-named topics of the two forums don't share them
+        name = topic_id_map.get(topic.url) or self.item_name(topic)
+        nav = self.topic_page_nav(name, number, len(pages)) if len(pages) > 1 else None
         
-        # Title
-        md.append(f"# {topic['title']}")
-        md.append('')
+        if number == 1:
+            # Frontmatter
+            yield '---'
+            yield f"id: {topic.id}"
+            yield f"title: \"{topic.title}\""
+            yield f"date: {topic.date}"
+            yield f"author: {topic.author}"
+            yield f"url: {topic.url}"
+            if topic.tags:
+                yield f"tags: [{', '.join([self.sanitize_tag(t) for t in topic.tags])}]"
+            yield '---'
+            yield ''
+            
+            # Title
+            yield f"# {topic.title}"
+        else:
+            yield f"# {topic.title} (Page {number} of {len(pages)})"
+        yield ''
         
         # Topic info
-        md.append(f"**Author:** {topic['author']}")
-        md.append(f"**Created:** {self.format_date(topic['date'])}")
-        if topic.get('posts'):
-            last_post_date = self.format_date(topic['posts'][-1]['date'])
-            md.append(f"**Last Activity:** {last_post_date}")
-        md.append('')
-        md.append('---')
-        md.append('')
+        yield f"**Author:** {topic.author}"
+        yield f"**Created:** {topic.date}"
+        if topic.replies:
+            yield f"**Last Activity:** {topic.activity_date}"
+        yield ''
+        yield '---'
+        yield ''
+        if nav:
+            yield nav
+            yield ''
         
         # Posts
-        if topic.get('posts'):
-            for i, post in enumerate(topic['posts']):
-                # First post is the topic body
-                if i == 0:
-                    md.append('## Original Post')
-                    md.append('')
-                else:
-                    md.append(f"## Reply by {post['author']}")
-                    md.append('')
-                
-                md.append(f"*{self.format_date(post['date'])}*")
-                md.append('')
-                
-                # Convert body to markdown
-                body_md = self.html_to_markdown(post['body'], base_url, topic_id_map)
-                md.append(body_md)
-                md.append('')
-                md.append('---')
-                md.append('')
+        offset = sum(len(page) for page in pages[:number - 1])
+        for i, post in enumerate(pages[number - 1], offset):
+            # First post is the topic body
+            if i == 0:
+                yield '## Original Post'
+                yield ''
+            else:
+                yield f"## Reply by {post.author}"
+                yield ''
+            
+            yield f"*{post.date}*"
+            yield ''
+            
+            # Convert body to markdown
+            yield self.html_to_markdown(post.body, base_url, topic_id_map)
+            yield ''
+            yield '---'
+            yield ''
         
-        return '\n'.join(md)
+        if nav:
+            yield nav
     
-    def create_forum_index(self, topics, forum_name, output_path):
+    def create_forum_index(self, view, forum_name, output_path):
         """Create an index file listing all forum topics sorted by last activity"""
         md = []
         
         md.append(f'# {forum_name} Archive')
         md.append('')
-        md.append(f'Total topics: {len(topics)}')
+        md.append(f'Total topics: {len(view.items)}')
         md.append('')
         
-        # Sort topics by most recent post date (reverse chronological)
-        sorted_topics = sorted(topics, key=self.get_latest_post_date, reverse=True)
-        
-        for topic in sorted_topics:
-            filename = self.sanitize_filename(topic['title'])
-            created_date = self.format_date(topic['date'])
-            latest_date = self.format_date(topic['posts'][-1]['date']) if topic.get('posts') else created_date
+        for topic in view.by_activity:
+            filename = self.item_name(topic)
+            created_date = topic.date
+            latest_date = topic.activity_date
             
             # Create entry with wiki link
-            md.append(f"- [[{forum_name}/{filename}|{topic['title']}]]")
-            md.append(f"  - Created: *{created_date}* by {topic['author']}")
+            md.append(f"- [[{forum_name}/{filename}|{topic.title}]]")
+            md.append(f"  - Created: *{created_date}* by {topic.author}")
             md.append(f"  - Last Activity: *{latest_date}*")
-            if topic.get('posts'):
-                md.append(f"  - Replies: {len(topic['posts']) - 1}")
+            if topic.replies:
+                md.append(f"  - Replies: {len(topic.replies) - 1}")
             
             # Add tags if present
-            if topic.get('tags'):
-                md.append(f"  - Tags: {', '.join(['#'+self.sanitize_tag(t) for t in topic['tags']])}")
+            if topic.tags:
+                md.append(f"  - Tags: {', '.join(['#'+self.sanitize_tag(t) for t in topic.tags])}")
         
         # Write index file
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(md))
+        self.writer.write(output_path, '\n'.join(md))
         
-        print(f"Created {forum_name} index at {output_path}")
+        print(f"Created {forum_name} index at {self.writer.destination(output_path)}")
     
-    def build_forum_vault(self, forum_data, forum_name, forum_path, base_url, unified_id_map):
+    def build_forum_vault(self, forum_data, forum_name, forum_path, base_url, unified_id_map, jobs=1, view=None):
         """Build vault from forum topics"""
         topics = forum_data['topics']
         
-        for topic in topics:
-            # Create filename from title
-            filename = self.sanitize_filename(topic['title']) + '.md'
-            filepath = os.path.join(forum_path, filename)
-            
-            # Generate markdown
-            markdown = self.build_forum_topic(topic, unified_id_map, base_url)
-            
-            # Write file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(markdown)
+        # Create filenames from titles
+        filepaths = [os.path.join(forum_path, self.item_name(topic) + '.md') for topic in topics]
+        
+        # Generate markdown and write files
+        render_to_files(self, 'build_forum_topic', full_items(forum_data, 'topics'), filepaths, unified_id_map, base_url, jobs, forum_name)
         
         # Create forum index
         index_path = os.path.join(self.vault_path, f'{forum_name} Archive.md')
-        self.create_forum_index(topics, forum_name, index_path)
+        self.create_forum_index(view or CollectionView(forum_data, 'topics'), forum_name, index_path)
         
-        print(f"Created {len(topics)} forum topic files in {forum_path}")
+        print(f"Created {len(topics)} forum topic files in {self.writer.destination(forum_path)}")
+    
+    def build_single_item(self, f, item, unified_id_map, base_url):
+        """Write the note for one post or topic of raw file f, returning its path"""
+        if f == 'blog':
+            folder, method = self.blog_path, 'build_blog_post'
+        else:
+            folder = self.fvp_forum_path if f == 'fvp_forum' else self.general_forum_path
+            method = 'build_forum_topic'
+        filepath = os.path.join(folder, self.item_name(item) + '.md')
+        render_to_files(self, method, [item], [filepath], unified_id_map, base_url)
+        return filepath
 
 
-class HTMLSiteBuilder:
-    """Builds a standalone HTML site from blog and forum data"""
-    
-    def __init__(self, conf):
-        self.conf = conf
-        self.root = conf['root']
+class SearchIndex:
+    """Inverted index of the HTML site for its client-side search page
+
+    Posts and topics are added as their pages are rendered, in any order and
+    in any process; the partial indexes of workers are merged into the
+    parent's. Each term maps to (document, weight) pairs, the weight being
+    the term's count in each field times the field's weight.
+
+    The index is written to the search directory as shards of terms keyed by
+    their first two characters and chunks of document records, so the search
+    page only fetches the shards and records a query needs.
+
+    The term weights of every item indexed are saved to path, keyed by a
+    hash of the item, so that later builds only tokenize items that changed.
+    """
+    MAGIC = b'markforster-search-weights 1\n'
+    DOC_CHUNK = 500
+    FIELD_WEIGHTS = {'title': 5, 'tags': 3, 'author': 2, 'body': 1}
+    TERM_PATTERN = re.compile(r'[^\W_]+')
+    PUNCTUATION = bytes.maketrans(b'!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~', b' ' * 32)
+    MARKUP_PATTERN = re.compile(r'<[^>]*>')
+    SHARD_PATTERN = re.compile(r'[a-z0-9]{2}')
+    STOP_WORDS = frozenset(
+        'a an and are as at be but by for from has have i if in is it its me my no not of on or so '
+        'that the their them there they this to was we were what when which who will with you your'.split())
+
+    def __init__(self, path=None):
+        self.path = path
+        # Document records: [page path, title, date]
+        self.docs = []
+        # Term -> flat array of document, weight pairs
+        self.postings = {}
+        self.seconds = 0.0
+        # Term weights by item hash, of the last build and of this one
+        self.saved = {}
+        self.weights = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    if f.readline() == self.MAGIC:
+                        self.saved = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                self.saved = {}
+
+    @classmethod
+    def term_counts(cls, text):
+        """Count the indexed terms of some text, split as the search page splits a query"""
+        # Splitting the UTF-8 bytes at whitespace and ASCII punctuation is much
+        # faster than TERM_PATTERN and leaves only the few distinct words with
+        # other characters to split again
+        words = collections.Counter(text.lower().encode('utf-8').translate(cls.PUNCTUATION).split())
+        counts = collections.Counter()
+        for word, count in words.items():
+            word = word.decode('utf-8')
+            for term in [word] if word.isalnum() else cls.TERM_PATTERN.findall(word):
+                if len(term) > 1 and term not in cls.STOP_WORDS:
+                    counts[term] += count
+        return counts
+
+    @classmethod
+    def term_weights(cls, item):
+        """Weighted counts of the terms of a post or topic over all of its fields"""
+        # Count each field's terms in one pass over all of its text
+        fields = {
+            'title': item.title,
+            'tags': ' '.join(item.tags),
+            'author': ' '.join(author for author in [item.author] + [reply.author for reply in item.replies] if author),
+            'body': cls.MARKUP_PATTERN.sub(' ', ' '.join(item_bodies(item))),
+        }
+        weights = collections.Counter()
+        for field, text in fields.items():
+            weight = cls.FIELD_WEIGHTS[field]
+            for term, count in cls.term_counts(unescape(text)).items():
+                weights[term] += weight * count
+        return weights
+
+    def shard(self, term):
+        return term[:2] if self.SHARD_PATTERN.fullmatch(term[:2]) else '_'
+
+    def add(self, path, item):
+        """Index a post or topic whose page is at path, relative to the site root"""
+        tic = Tic()
+        key = hashlib.sha1('\0'.join(item.fields()).encode('utf-8', 'surrogatepass')).digest()
+        weights = self.saved.get(key)
+        if weights is None:
+            weights = self.term_weights(item)
+        self.weights[key] = weights
+        doc = len(self.docs)
+        self.docs.append([path, unescape(item.title), item.date])
+        for term, weight in weights.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = array.array('l')
+            postings.append(doc)
+            postings.append(weight)
+        self.seconds += tic.toc()
+
+    def take(self):
+        """Documents added since the last call, for a worker to send back"""
+        part = SearchIndex()
+        part.docs, self.docs = self.docs, part.docs
+        part.postings, self.postings = self.postings, part.postings
+        part.seconds, self.seconds = self.seconds, part.seconds
+        part.weights, self.weights = self.weights, part.weights
+        return part
+
+    def merge(self, part):
+        offset = len(self.docs)
+        self.docs.extend(part.docs)
+        for term, pairs in part.postings.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = array.array('l')
+            for i in range(0, len(pairs), 2):
+                postings.append(pairs[i] + offset)
+                postings.append(pairs[i + 1])
+        self.seconds += part.seconds
+        self.weights.update(part.weights)
+    
+    def save(self):
+        """Write the term weights of the items indexed by this build if they are not the saved ones"""
+        if not self.path or self.weights.keys() == self.saved.keys():
+            return
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(self.MAGIC)
+            pickle.dump(self.weights, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.path)
+
+    def write(self, writer, search_path, collections_by_dir):
+        """Write the index through writer, returning the number of terms, shards and bytes written
+
+        Documents are numbered in order of their paths, so the output does
+        not depend on the order pages were rendered in. Each term's postings
+        are written as document number deltas and weights, flattened.
+        """
+        order = sorted(range(len(self.docs)), key=lambda doc: self.docs[doc][0])
+        number = {doc: n for n, doc in enumerate(order)}
+        
+        shards = {}
+        for term, pairs in self.postings.items():
+            entries = sorted((number[pairs[i]], pairs[i + 1]) for i in range(0, len(pairs), 2))
+            flat = []
+            previous = 0
+            for doc, weight in entries:
+                flat.append(doc - previous)
+                flat.append(weight)
+                previous = doc
+            shards.setdefault(self.shard(term), {})[term] = flat
+        
+        files = {}
+        for name, terms in shards.items():
+            files[f'terms-{name}.json'] = {term: terms[term] for term in sorted(terms)}
+        docs = [self.docs[doc] for doc in order]
+        for chunk in range(0, max(len(docs), 1), self.DOC_CHUNK):
+            files[f'docs-{chunk // self.DOC_CHUNK}.json'] = docs[chunk:chunk + self.DOC_CHUNK]
+        files['meta.json'] = {
+            'docs': len(docs),
+            'doc_chunk': self.DOC_CHUNK,
+            'shards': sorted(shards),
+            'collections': collections_by_dir,
+            'stop_words': sorted(self.STOP_WORDS),
+        }
+        
+        size = 0
+        for name, data in files.items():
+            text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+            writer.write(os.path.join(search_path, name), text)
+            size += len(text.encode('utf-8'))
+        
+        # Shards and chunks left over from a larger index
+        for name in os.listdir(search_path) if os.path.isdir(search_path) else []:
+            if name.endswith('.json') and name not in files:
+                writer.remove(os.path.join(search_path, name))
+        return len(self.postings), len(shards), size
+
+
+class HTMLSiteBuilder:
+    """Builds a standalone HTML site from blog and forum data"""
+    
+    def __init__(self, conf):
+        self.conf = conf
+        self.root = conf['root']
         self.html_path = os.path.join(self.root, conf.get('html_path', 'html_site'))
         self.blog_path = os.path.join(self.html_path, 'blog')
         self.fvp_forum_path = os.path.join(self.html_path, 'fvp_forum')
         self.general_forum_path = os.path.join(self.html_path, 'general_forum')
-        os.makedirs(self.blog_path, exist_ok=True)
-        os.makedirs(self.fvp_forum_path, exist_ok=True)
-        os.makedirs(self.general_forum_path, exist_ok=True)
-        
-        # Create default CSS file
+        self.manifest = None
+        # Creates folders as files are written into them; replaced to write elsewhere
+        self.writer = OutputWriter()
+        self.link_report = collections.Counter()
+        # Entries per page of the blog and forum indexes; set from --page_size
+        self.page_size = 100
+        # Posts per page of a long forum topic; set from --replies_per_page
+        self.replies_per_page = 100
+        # Date subfolders items go in, 'year' or 'month'; set from --shard
+        self.shard = None
+        # Comments and replies shown before the rest are loaded on demand; set from --lazy_comments
+        self.lazy_comments = None
+        # Whether pages link to the search page; cleared by --no_search
+        self.search_enabled = True
+        # Filled as pages are rendered when the search page is built
+        self.search_index = None
+    
+    def create_assets(self):
+        """Create the CSS file and the script that loads comment fragments"""
         self.create_default_css()
+        self.create_lazy_script()
     
     def create_default_css(self):
         """Create a simple brutalist CSS file"""
@@ -689,6 +2153,38 @@ hr {
     border-bottom: 1px solid #eee;
 }
 
+.pager {
+    margin: 20px 0;
+    font-weight: bold;
+}
+
+.lazy-section {
+    margin: 30px 0;
+    font-weight: bold;
+}
+
+.search-form {
+    margin-bottom: 30px;
+}
+
+.search-form input {
+    font-size: 1.1em;
+    padding: 5px;
+    width: 70%;
+    border: 2px solid #000;
+}
+
+.search-form button {
+    font-size: 1.1em;
+    padding: 5px 15px;
+    border: 2px solid #000;
+    background: #fff;
+}
+
+.years a {
+    margin-right: 10px;
+}
+
 footer {
     margin-top: 60px;
     padding-top: 20px;
@@ -697,110 +2193,119 @@ footer {
 }
 """
         css_path = os.path.join(self.html_path, 'style.css')
-        with open(css_path, 'w', encoding='utf-8') as f:
-            f.write(css.strip())
+        self.writer.write(css_path, css.strip())
+    
+    def create_lazy_script(self):
+        """Create the script that replaces a lazy section with the fragment it links to"""
+        js = """
+document.addEventListener('click', function (event) {
+    var link = event.target.closest('.lazy-section a');
+    if (!link) {
+        return;
+    }
+    event.preventDefault();
+    var section = link.parentNode;
+    fetch(link.href).then(function (response) {
+        if (!response.ok) {
+            throw new Error(response.statusText);
+        }
+        return response.text();
+    }).then(function (html) {
+        section.outerHTML = html;
+    }).catch(function () {
+        // Fall back to opening the fragment, e.g. for pages viewed from disk
+        window.location.href = link.href;
+    });
+});
+"""
+        js_path = os.path.join(self.html_path, 'lazy.js')
+        self.writer.write(js_path, js.strip())
     
     def sanitize_filename(self, title):
-        """Create a safe filename from a title"""
-        safe = title.replace('\xa0', ' ')
-        safe = re.sub(r'[<>:"/\\|?*#^]', '', safe)
-        safe = re.sub(r'\s+', '_', safe)
-        safe = safe.strip('_')
-        if len(safe) > 200:
-            safe = safe[:200]
-        return safe.lower()
+        """Create a safe filename from a title, the same as the vault's"""
+        return ObsidianVaultBuilder.sanitize_filename(title)
     
     def format_date(self, date_obj):
         """Format date object to readable string"""
-        return f"{date_obj['year']}-{date_obj['month']}-{date_obj['day']} {date_obj.get('time', '00:00')}"
+        return format_date(date_obj)
+    
+    def item_name(self, item):
+        """Name of an item's page within its collection's directory, in its date subfolders if sharded"""
+        return shard_folder(item.sort_key, self.shard) + item.slug
+    
+    def item_root(self):
+        """Prefix leading from an item page to the site root"""
+        return item_page_root(self.shard)
     
     def build_unified_url_map(self, blog_data, fvp_forum_data, general_forum_data):
-        """Build a unified mapping of URLs to HTML file paths"""
+        """Build a unified mapping of URLs to HTML file paths, relative to the item pages"""
         url_map = {}
+        root = self.item_root()
         
         # Blog posts
         for post in blog_data['posts']:
-            filename = self.sanitize_filename(post['title']) + '.html'
-            url_map[post['url']] = f'../blog/{filename}'
+            filename = self.item_name(post) + '.html'
+            url_map[post.url] = f'{root}blog/{filename}'
         
         # FVP Forum topics
         for topic in fvp_forum_data['topics']:
-            filename = self.sanitize_filename(topic['title']) + '.html'
-            url_map[topic['url']] = f'../fvp_forum/{filename}'
+            filename = self.item_name(topic) + '.html'
+            url_map[topic.url] = f'{root}fvp_forum/{filename}'
         
         # General Forum topics
         for topic in general_forum_data['topics']:
-            filename = self.sanitize_filename(topic['title']) + '.html'
-            url_map[topic['url']] = f'../general_forum/{filename}'
+            filename = self.item_name(topic) + '.html'
+            url_map[topic.url] = f'{root}general_forum/{filename}'
         
         return url_map
     
     def convert_links_to_html(self, html, base_url, url_map):
         """Convert internal links in HTML to local file links"""
-        from html.parser import HTMLParser
-        
-        class LinkConverter(HTMLParser):
-            def __init__(self, base_url, url_map):
-                super().__init__()
-                self.base_url = base_url
-                self.url_map = url_map
-                self.output = []
-            
-            def handle_starttag(self, tag, attrs):
-                if tag == 'a':
-                    new_attrs = []
-                    href = None
-                    for attr, value in attrs:
-                        if attr == 'href':
-                            href = value
-                        else:
-                            new_attrs.append(f'{attr}="{value}"')
-                    
-                    if href:
-                        # Check if internal link
-                        try:
-                            parsed = urlparse(href)
-                            base_parsed = urlparse(base_url)
-                            is_internal = parsed.netloc == base_parsed.netloc or not parsed.netloc
-                            
-                            if is_internal and href in url_map:
-                                href = url_map[href]
-                        except:
-                            pass
-                        
-                        new_attrs.insert(0, f'href="{href}"')
-                    
-                    attrs_str = ' '.join(new_attrs)
-                    self.output.append(f'<{tag} {attrs_str}>')
-                else:
-                    attrs_str = ' '.join([f'{k}="{v}"' for k, v in attrs])
-                    if attrs_str:
-                        self.output.append(f'<{tag} {attrs_str}>')
-                    else:
-                        self.output.append(f'<{tag}>')
-            
-            def handle_endtag(self, tag):
-                self.output.append(f'</{tag}>')
-            
-            def handle_data(self, data):
-                self.output.append(data)
-            
-            def get_html(self):
-                return ''.join(self.output)
-        
-        converter = LinkConverter(base_url, url_map)
-        try:
-            converter.feed(html)
-            return converter.get_html()
-        except:
-            return html
+        html, rewritten, untouched = rewrite_links(html, url_map)
+        self.link_report['rewritten'] += len(rewritten)
+        self.link_report['untouched'] += len(untouched)
+        return html
+    
+    def take_updates(self):
+        """Link counts, search documents and write counts since the last call, for a worker to send back"""
+        report, self.link_report = self.link_report, collections.Counter()
+        search = self.search_index.take() if self.search_index is not None else None
+        return report, search, self.writer.take()
+    
+    def merge_updates(self, updates):
+        report, search, writes = updates
+        self.link_report.update(report)
+        if search is not None:
+            self.search_index.merge(search)
+        self.writer.merge(writes)
+    
+    def index_item(self, item, url_map):
+        """Add a post or topic to the search index, if there is one"""
+        if self.search_index is not None:
+            self.search_index.add(url_map.get(item.url).removeprefix(self.item_root()), item)
+    
+    def item_unchanged(self, item, url_map):
+        """The manifest skipped rendering an item; it still goes into the search index"""
+        self.index_item(item, url_map)
+    
+    def link_target(self, href, url_map):
+        """Look up the local page a link points to, as convert_links_to_html does"""
+        return url_map.get(href)
     
     def build_html_template(self, title, content, nav_prefix=''):
         """Build HTML page with template
         
         nav_prefix: prefix for navigation links (empty string for root level, '../' for subdirs)
         """
-        return f"""<!DOCTYPE html>
+        head, tail = self.html_template_parts(title, nav_prefix)
+        return head + content + tail
+    
+    def html_template_parts(self, title, nav_prefix=''):
+        """The page template before and after the content, for pages written as a stream"""
+        search_link = ''
+        if self.search_enabled:
+            search_link = f'\n            <a href="{nav_prefix}search.html">Search</a>'
+        head = f"""<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -814,177 +2319,519 @@ footer {
             <a href="{nav_prefix}index.html">Home</a>
             <a href="{nav_prefix}blog_index.html">Blog</a>
             <a href="{nav_prefix}fvp_forum_index.html">FVP Forum</a>
-            <a href="{nav_prefix}general_forum_index.html">General Forum</a>
+            <a href="{nav_prefix}general_forum_index.html">General Forum</a>{search_link}
         </nav>
     </header>
     <main>
-{content}
+"""
+        tail = """
     </main>
     <footer>
         <p>Archive built from Mark Forster's blog and forums</p>
     </footer>
 </body>
 </html>"""
+        return head, tail
     
-    def build_blog_post_html(self, post, url_map, base_url):
-        """Convert a blog post to HTML"""
+    def build_blog_post_html(self, post, url_map, base_url, fragment=None):
+        """Convert a blog post to HTML
+        
+        If fragment is given, the comments after the first lazy_comments are
+        left out and a link to load them from that fragment file put in their place.
+        """
         content = []
         
         content.append(f'<article>')
-        content.append(f'<h1>{post["title"]}</h1>')
-        content.append(f'<div class="meta">Posted: {self.format_date(post["date"])}</div>')
-        content.append(f'<div class="content">{self.convert_links_to_html(post["body"], base_url, url_map)}</div>')
+        content.append(f'<h1>{post.title}</h1>')
+        content.append(f'<div class="meta">Posted: {post.date}</div>')
+        content.append(f'<div class="content">{self.convert_links_to_html(post.body, base_url, url_map)}</div>')
         
         # Comments
-        if post.get('comments'):
+        if post.replies:
+            comments, deferred = self.split_deferred(post.replies, self.lazy_comments if fragment else None)
             content.append(f'<hr>')
-            content.append(f'<h2>Comments ({len(post["comments"])})</h2>')
-            for comment in post['comments']:
-                content.append(f'<div class="comment">')
-                content.append(f'<div class="comment-meta">{comment["author"]} - {self.format_date(comment["date"])}</div>')
-                content.append(f'<div>{self.convert_links_to_html(comment["body"], base_url, url_map)}</div>')
-                content.append(f'</div>')
+            content.append(f'<h2>Comments ({len(post.replies)})</h2>')
+            for comment in comments:
+                content.extend(self.build_comment_html(comment, url_map, base_url))
+            if deferred:
+                content.extend(self.lazy_section(fragment, len(deferred), 'comments'))
         
         content.append(f'</article>')
         return '\n'.join(content)
     
-    def build_forum_topic_html(self, topic, url_map, base_url):
-        """Convert a forum topic to HTML"""
-        content = []
+    def build_comment_html(self, comment, url_map, base_url):
+        return [
+            f'<div class="comment">',
+            f'<div class="comment-meta">{comment.author} - {comment.date}</div>',
+            f'<div>{self.convert_links_to_html(comment.body, base_url, url_map)}</div>',
+            f'</div>',
+        ]
+    
+    def build_topic_post_html(self, i, post, url_map, base_url):
+        """HTML of the i-th post of a forum topic, the first being the original post"""
+        if i == 0:
+            heading = f'<h2>Original Post</h2>'
+        else:
+            heading = f'<h2>Reply by {post.author}</h2>'
+        return [
+            heading,
+            f'<div class="meta">{post.date}</div>',
+            f'<div class="content">{self.convert_links_to_html(post.body, base_url, url_map)}</div>',
+        ]
+    
+    def split_deferred(self, replies, keep):
+        """Split replies into those shown in the page and those left for a fragment, keeping all if keep is None"""
+        if keep is None:
+            return replies, ()
+        return replies[:keep], replies[keep:]
+    
+    def lazy_section(self, fragment, count, noun):
+        """Placeholder for replies loaded from a fragment file when the reader asks for them
         
-        content.append(f'<article>')
-        content.append(f'<h1>{topic["title"]}</h1>')
-        content.append(f'<div class="meta">')
-        content.append(f'Author: {topic["author"]} | ')
-        content.append(f'Created: {self.format_date(topic["date"])}')
-        if topic.get('posts'):
-            content.append(f' | Last Activity: {self.format_date(topic["posts"][-1]["date"])}')
-        content.append(f'</div>')
+        Without JavaScript, or when the fragment can't be fetched, the link
+        opens the fragment itself.
+        """
+        return [
+            f'<div class="lazy-section">',
+            f'<a href="{escape(fragment)}">Show {count} more {noun}</a>',
+            f'</div>',
+            f'<script src="{self.item_root()}lazy.js" defer></script>',
+        ]
+    
+    def fragment_files(self, name, lines):
+        """A fragment file of HTML lines and its gzip-compressed copy, by file name"""
+        text = '\n'.join(lines)
+        return {name: text, name + '.gz': gzip.compress(text.encode('utf-8'), mtime=0)}
+    
+    def build_forum_topic_html(self, topic, pages, number, url_map, base_url, fragment=None):
+        """Yield the HTML lines of one page of a forum topic
+        
+        If fragment is given, the posts of the page after the first
+        lazy_comments replies are left for that fragment file, as for blog comments.
+        """
+        nav = self.topic_page_nav(topic.slug, number, len(pages)) if len(pages) > 1 else None
+        posts, deferred = self.split_deferred(pages[number - 1], self.page_keep(number) if fragment else None)
+        
+        yield f'<article>'
+        if number == 1:
+            yield f'<h1>{topic.title}</h1>'
+        else:
+            yield f'<h1>{topic.title} (Page {number} of {len(pages)})</h1>'
+        yield f'<div class="meta">'
+        yield f'Author: {topic.author} | '
+        yield f'Created: {topic.date}'
+        if topic.replies:
+            yield f' | Last Activity: {topic.activity_date}'
+        yield f'</div>'
+        if nav:
+            yield nav
         
         # Posts
-        if topic.get('posts'):
-            for i, post in enumerate(topic['posts']):
-                if i == 0:
-                    content.append(f'<h2>Original Post</h2>')
-                else:
-                    content.append(f'<h2>Reply by {post["author"]}</h2>')
-                
-                content.append(f'<div class="meta">{self.format_date(post["date"])}</div>')
-                content.append(f'<div class="content">{self.convert_links_to_html(post["body"], base_url, url_map)}</div>')
+        offset = sum(len(page) for page in pages[:number - 1])
+        for i, post in enumerate(posts, offset):
+            yield from self.build_topic_post_html(i, post, url_map, base_url)
+        if deferred:
+            yield from self.lazy_section(fragment, len(deferred), 'replies')
         
-        content.append(f'</article>')
-        return '\n'.join(content)
+        if nav:
+            yield nav
+        yield f'</article>'
+    
+    def topic_page_nav(self, slug, number, count):
+        """Links from a page of a long topic to its neighbours and to every page"""
+        links = []
+        if number > 1:
+            links.append(f'<a href="{escape(page_name(slug, number - 1))}.html" rel="prev">&larr; Previous</a>')
+        links.append('Pages: ' + ' '.join(str(n) if n == number else f'<a href="{escape(page_name(slug, n))}.html">{n}</a>' for n in range(1, count + 1)))
+        if number < count:
+            links.append(f'<a href="{escape(page_name(slug, number + 1))}.html" rel="next">Next &rarr;</a>')
+        return f'<div class="pager">{" | ".join(links)}</div>'
+    
+    def stream_html_page(self, title, lines, nav_prefix=''):
+        """Yield the text of a page built with the template, as build_html_template would return it"""
+        head, tail = self.html_template_parts(title, nav_prefix)
+        yield head
+        yield from join_lines(lines)
+        yield tail
     
-    def build_blog_html(self, blog_data, url_map):
+    def page_keep(self, number):
+        """Posts of a topic page shown before the rest are deferred; the original post doesn't count"""
+        return self.lazy_comments + 1 if number == 1 else self.lazy_comments
+    
+    def build_blog_post_page(self, post, url_map, base_url):
+        """Render the complete HTML page for a blog post, with its comment fragment if comments are lazy"""
+        self.index_item(post, url_map)
+        if self.lazy_comments is None or len(post.replies) <= self.lazy_comments:
+            content = self.build_blog_post_html(post, url_map, base_url)
+            return self.build_html_template(post.title, content, nav_prefix=self.item_root())
+        
+        fragment = post.slug + '.comments.html'
+        content = self.build_blog_post_html(post, url_map, base_url, fragment)
+        files = {post.slug + '.html': self.build_html_template(post.title, content, nav_prefix=self.item_root())}
+        deferred = post.replies[self.lazy_comments:]
+        files.update(self.fragment_files(fragment, (line for comment in deferred for line in self.build_comment_html(comment, url_map, base_url))))
+        return files
+    
+    def build_forum_topic_page(self, topic, url_map, base_url):
+        """Render the HTML pages of a forum topic by file name, replies_per_page posts each, as streams of text
+        
+        If comments are lazy, each page with more posts than it shows also gets a fragment file.
+        """
+        self.index_item(topic, url_map)
+        pages = reply_pages(topic.replies, self.replies_per_page)
+        offset = 0
+        files = {}
+        for number, posts in enumerate(pages, 1):
+            name = page_name(topic.slug, number)
+            fragment = None
+            if self.lazy_comments is not None and len(posts) > self.page_keep(number):
+                fragment = name + '.comments.html'
+                keep = self.page_keep(number)
+                lines = (line for i, post in enumerate(posts[keep:], offset + keep) for line in self.build_topic_post_html(i, post, url_map, base_url))
+                files.update(self.fragment_files(fragment, lines))
+            files[name + '.html'] = self.stream_html_page(topic.title if number == 1 else f'{topic.title} - Page {number}',
+                                                          self.build_forum_topic_html(topic, pages, number, url_map, base_url, fragment), nav_prefix=self.item_root())
+            offset += len(posts)
+        return files
+    
+    def build_blog_html(self, blog_data, url_map, jobs=1):
         """Build HTML files for all blog posts"""
         posts = blog_data['posts']
-        base_url = posts[0]['url'] if posts else 'http://markforster.squarespace.com'
+        base_url = posts[0].url if posts else 'http://markforster.squarespace.com'
         
-        for post in posts:
-            filename = self.sanitize_filename(post['title']) + '.html'
-            filepath = os.path.join(self.blog_path, filename)
-            
-            content = self.build_blog_post_html(post, url_map, base_url)
-            html = self.build_html_template(post['title'], content, nav_prefix='../')
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(html)
+        filepaths = [os.path.join(self.blog_path, self.item_name(post) + '.html') for post in posts]
+        render_to_files(self, 'build_blog_post_page', full_items(blog_data, 'posts'), filepaths, url_map, base_url, jobs, 'Blog')
         
-        print(f"Created {len(posts)} blog HTML files in {self.blog_path}")
+        print(f"Created {len(posts)} blog HTML files in {self.writer.destination(self.blog_path)}")
     
-    def build_forum_html(self, forum_data, forum_dir, forum_name, base_url, url_map):
+    def build_forum_html(self, forum_data, forum_dir, forum_name, base_url, url_map, jobs=1):
         """Build HTML files for all forum topics"""
         topics = forum_data['topics']
         forum_path = os.path.join(self.html_path, forum_dir)
         
-        for topic in topics:
-            filename = self.sanitize_filename(topic['title']) + '.html'
-            filepath = os.path.join(forum_path, filename)
+        filepaths = [os.path.join(forum_path, self.item_name(topic) + '.html') for topic in topics]
+        render_to_files(self, 'build_forum_topic_page', full_items(forum_data, 'topics'), filepaths, url_map, base_url, jobs, forum_name)
+        
+        print(f"Created {len(topics)} {forum_name} HTML files in {self.writer.destination(forum_path)}")
+    
+    def build_single_item(self, f, item, url_map, base_url):
+        """Write the page for one post or topic of raw file f, returning its path"""
+        if f == 'blog':
+            folder, method = self.blog_path, 'build_blog_post_page'
+        else:
+            folder = self.fvp_forum_path if f == 'fvp_forum' else self.general_forum_path
+            method = 'build_forum_topic_page'
+        filepath = os.path.join(folder, self.item_name(item) + '.html')
+        render_to_files(self, method, [item], [filepath], url_map, base_url)
+        return filepath
+    
+    def relative_href(self, from_path, to_path):
+        """Link from one site-relative page to another; index pages are at most one directory deep"""
+        return '../' * from_path.count('/') + to_path
+    
+    def index_page_path(self, name, number):
+        """Site-relative path of a page of a collection's index, the first being the top-level page"""
+        if number == 1:
+            return f'{name}_index.html'
+        return f'{name}_archive/page-{number}.html'
+    
+    def year_page_path(self, name, year):
+        return f'{name}_archive/{year}.html'
+    
+    def month_page_path(self, name, year, month):
+        return f'{name}_archive/{year}-{month:02d}.html'
+    
+    def write_index_page(self, path, title, content):
+        """Write an index page at a site-relative path, returning the path"""
+        html = self.build_html_template(title, '\n'.join(content), nav_prefix=self.relative_href(path, ''))
+        filepath = os.path.join(self.html_path, path)
+        self.writer.write(filepath, html)
+        return path
+    
+    def pager(self, path, newer=None, older=None, up=None):
+        """Navigation from a page to its newer and older neighbours and its parent, each a (path, label) pair"""
+        links = []
+        if newer:
+            links.append(f'<a href="{self.relative_href(path, newer[0])}" rel="prev">&larr; {newer[1]}</a>')
+        if up:
+            links.append(f'<a href="{self.relative_href(path, up[0])}">{up[1]}</a>')
+        if older:
+            links.append(f'<a href="{self.relative_href(path, older[0])}" rel="next">{older[1]} &rarr;</a>')
+        if not links:
+            return ''
+        return f'<div class="pager">{" | ".join(links)}</div>'
+    
+    def year_links(self, path, name, view):
+        """Links from a page to each year of a collection's archive"""
+        links = [f'<a href="{self.relative_href(path, self.year_page_path(name, year))}">{year}</a>' for year in view.years]
+        return f'<p class="years">By year: {" ".join(links)}</p>'
+    
+    def blog_index_entry(self, post, prefix):
+        """Index entry for a blog post; prefix leads from the index page to the site root"""
+        filename = self.item_name(post) + '.html'
+        return [
+            f'<div class="index-item">',
+            f'<h2><a href="{prefix}blog/{escape(filename)}">{post.title}</a></h2>',
+            f'<div class="meta">{post.date}</div>',
+            f'</div>',
+        ]
+    
+    def forum_index_entry(self, topic, prefix, forum_dir):
+        """Index entry for a forum topic; prefix leads from the index page to the site root"""
+        filename = self.item_name(topic) + '.html'
+        created_date = topic.date
+        latest_date = topic.activity_date
+        
+        content = []
+        content.append(f'<div class="index-item">')
+        content.append(f'<h2><a href="{prefix}{forum_dir}/{escape(filename)}">{topic.title}</a></h2>')
+        content.append(f'<div class="meta">')
+        content.append(f'Created: {created_date} by {topic.author} | ')
+        content.append(f'Last Activity: {latest_date}')
+        if topic.replies:
+            content.append(f' | Replies: {len(topic.replies) - 1}')
+        content.append(f'</div>')
+        content.append(f'</div>')
+        return content
+    
+    def build_paged_index_html(self, name, title, items, entry, header):
+        """Write a collection's index split into pages of page_size items
+        
+        The first page is the collection's top-level index and starts with header.
+        """
+        pages = [items[i:i + self.page_size] for i in range(0, len(items), self.page_size)] or [[]]
+        written = []
+        for number, page in enumerate(pages, 1):
+            path = self.index_page_path(name, number)
+            newer = (self.index_page_path(name, number - 1), 'Newer') if number > 1 else None
+            older = (self.index_page_path(name, number + 1), 'Older') if number < len(pages) else None
+            nav = self.pager(path, newer, older)
             
-            content = self.build_forum_topic_html(topic, url_map, base_url)
-            html = self.build_html_template(topic['title'], content, nav_prefix='../')
+            if number == 1:
+                content = list(header)
+            else:
+                content = [f'<h1>{title} - Page {number} of {len(pages)}</h1>']
+            content.append(nav)
+            prefix = self.relative_href(path, '')
+            for item in page:
+                content.extend(entry(item, prefix))
+            content.append(nav)
+            
+            written.append(self.write_index_page(path, title if number == 1 else f'{title} - Page {number}', content))
+        return written
+    
+    def build_date_archive_html(self, name, title, view, entry, noun):
+        """Write a page per year listing its months and a page per month listing its items"""
+        written = []
+        years = list(view.years)
+        months = list(view.months)
+        months_of_year = {year: list(group) for year, group in itertools.groupby(months, key=lambda ym: ym[0])}
+        
+        for i, year in enumerate(years):
+            path = self.year_page_path(name, year)
+            newer = (self.year_page_path(name, years[i - 1]), str(years[i - 1])) if i > 0 else None
+            older = (self.year_page_path(name, years[i + 1]), str(years[i + 1])) if i + 1 < len(years) else None
+            nav = self.pager(path, newer, older, (self.index_page_path(name, 1), title))
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(html)
+            content = [f'<h1>{title}: {year}</h1>', f'<p>{len(view.years[year])} {noun}</p>', nav, '<ul>']
+            for month_key in months_of_year[year]:
+                month_path = self.month_page_path(name, *month_key)
+                month_name = calendar.month_name[month_key[1]]
+                content.append(f'<li><a href="{self.relative_href(path, month_path)}">{month_name}</a> - {len(view.months[month_key])} {noun}</li>')
+            content.append('</ul>')
+            content.append(nav)
+            written.append(self.write_index_page(path, f'{title}: {year}', content))
         
-        print(f"Created {len(topics)} {forum_name} HTML files in {forum_path}")
+        for i, (year, month) in enumerate(months):
+            path = self.month_page_path(name, year, month)
+            label = f'{calendar.month_name[month]} {year}'
+            newer = (self.month_page_path(name, *months[i - 1]), f'{calendar.month_name[months[i - 1][1]]} {months[i - 1][0]}') if i > 0 else None
+            older = (self.month_page_path(name, *months[i + 1]), f'{calendar.month_name[months[i + 1][1]]} {months[i + 1][0]}') if i + 1 < len(months) else None
+            nav = self.pager(path, newer, older, (self.year_page_path(name, year), str(year)))
+            
+            items = view.months[(year, month)]
+            content = [f'<h1>{title}: {label}</h1>', f'<p>{len(items)} {noun}</p>', nav]
+            prefix = self.relative_href(path, '')
+            for item in items:
+                content.extend(entry(item, prefix))
+            content.append(nav)
+            written.append(self.write_index_page(path, f'{title}: {label}', content))
+        return written
     
-    def build_blog_index_html(self, blog_data):
-        """Build index page for blog"""
-        posts = blog_data['posts']
-        sorted_posts = sorted(posts, key=lambda p: (
-            int(p['date']['year']),
-            int(p['date']['month']),
-            int(p['date']['day']),
-            p['date'].get('time', '00:00')
-        ), reverse=True)
+    def remove_stale_index_pages(self, name, written):
+        """Delete pages of a collection's archive directory left over from a larger build"""
+        archive_dir = os.path.join(self.html_path, f'{name}_archive')
+        if not os.path.isdir(archive_dir):
+            return
+        current = {os.path.basename(path) for path in written}
+        for filename in os.listdir(archive_dir):
+            if filename.endswith('.html') and filename not in current:
+                self.writer.remove(os.path.join(archive_dir, filename))
+    
+    def build_blog_index_html(self, view):
+        """Build the paginated blog index and the per-year and per-month blog archive"""
+        header = ['<h1>Blog Archive</h1>', f'<p>Total posts: {len(view.items)}</p>', self.year_links('blog_index.html', 'blog', view)]
+        written = self.build_paged_index_html('blog', 'Blog Archive', view.by_date, self.blog_index_entry, header)
+        written += self.build_date_archive_html('blog', 'Blog Archive', view, self.blog_index_entry, 'posts')
+        self.remove_stale_index_pages('blog', written)
+    
+    def build_forum_index_html(self, view, forum_dir, forum_name):
+        """Build the paginated index of a forum by last activity and its archive by creation date"""
+        title = f'{forum_name} Archive'
+        entry = functools.partial(self.forum_index_entry, forum_dir=forum_dir)
+        header = [f'<h1>{title}</h1>', f'<p>Total topics: {len(view.items)}</p>', self.year_links(f'{forum_dir}_index.html', forum_dir, view)]
+        written = self.build_paged_index_html(forum_dir, title, view.by_activity, entry, header)
+        written += self.build_date_archive_html(forum_dir, title, view, entry, 'topics started')
+        self.remove_stale_index_pages(forum_dir, written)
+    
+    def build_search_html(self, collections_by_dir):
+        """Write the search index, the search page and its script, and report the index size"""
+        tic = Tic()
+        terms, shards, size = self.search_index.write(self.writer, os.path.join(self.html_path, 'search'), collections_by_dir)
         
         content = []
-        content.append('<h1>Blog Archive</h1>')
-        content.append(f'<p>Total posts: {len(posts)}</p>')
-        
-        for post in sorted_posts:
-            filename = self.sanitize_filename(post['title']) + '.html'
-            content.append(f'<div class="index-item">')
-            content.append(f'<h2><a href="blog/{filename}">{post["title"]}</a></h2>')
-            content.append(f'<div class="meta">{self.format_date(post["date"])}</div>')
-            content.append(f'</div>')
-        
-        html = self.build_html_template('Blog Archive', '\n'.join(content), nav_prefix='')
-        
-        index_path = os.path.join(self.html_path, 'blog_index.html')
-        with open(index_path, 'w', encoding='utf-8') as f:
-            f.write(html)
-    
-    def get_latest_post_date(self, topic):
-        """Get the date of the most recent post in a topic"""
-        if not topic.get('posts'):
-            return (
-                int(topic['date']['year']),
-                int(topic['date']['month']),
-                int(topic['date']['day']),
-                topic['date'].get('time', '00:00')
-            )
-        
-        last_post = topic['posts'][-1]
-        return (
-            int(last_post['date']['year']),
-            int(last_post['date']['month']),
-            int(last_post['date']['day']),
-            last_post['date'].get('time', '00:00')
-        )
-    
-    def build_forum_index_html(self, forum_data, forum_dir, forum_name):
-        """Build index page for a forum"""
-        topics = forum_data['topics']
-        sorted_topics = sorted(topics, key=self.get_latest_post_date, reverse=True)
+        content.append('<h1>Search</h1>')
+        content.append('<form id="search-form" class="search-form" action="search.html">')
+        content.append('<input type="search" name="q" id="search-query" placeholder="Search posts, comments, authors and tags" autofocus>')
+        content.append('<button type="submit">Search</button>')
+        content.append('</form>')
+        content.append('<noscript><p>Search needs JavaScript.</p></noscript>')
+        content.append('<div id="search-results"></div>')
+        content.append('<script src="search.js" defer></script>')
+        html = self.build_html_template('Search', '\n'.join(content), nav_prefix='')
+        self.writer.write(os.path.join(self.html_path, 'search.html'), html)
         
-        content = []
-        content.append(f'<h1>{forum_name} Archive</h1>')
-        content.append(f'<p>Total topics: {len(topics)}</p>')
+        js = r"""
+(function () {
+    var MAX_RESULTS = 50;
+    var form = document.getElementById('search-form');
+    var input = document.getElementById('search-query');
+    var results = document.getElementById('search-results');
+    var cache = {};
+
+    function load(name) {
+        if (!cache[name]) {
+            cache[name] = fetch('search/' + name).then(function (response) {
+                if (!response.ok) {
+                    throw new Error(name + ': ' + response.statusText);
+                }
+                return response.json();
+            });
+        }
+        return cache[name];
+    }
+
+    // Split text into terms the way the index builder does
+    function terms(meta, text) {
+        var stopWords = new Set(meta.stop_words);
+        var found = text.toLowerCase().match(/[\p{L}\p{N}]+/gu) || [];
+        return Array.from(new Set(found.filter(function (term) {
+            return term.length > 1 && !stopWords.has(term);
+        })));
+    }
+
+    function shard(term) {
+        return /^[a-z0-9]{2}/.test(term) ? term.slice(0, 2) : '_';
+    }
+
+    // Map document number to score for the documents containing every term
+    function score(meta, postings) {
+        var scores = null;
+        postings.forEach(function (flat) {
+            var idf = Math.log(1 + meta.docs / Math.max(flat.length / 2, 1));
+            var next = new Map();
+            var doc = 0;
+            for (var i = 0; i < flat.length; i += 2) {
+                doc += flat[i];
+                if (scores === null || scores.has(doc)) {
+                    next.set(doc, (scores === null ? 0 : scores.get(doc)) + flat[i + 1] * idf);
+                }
+            }
+            scores = next;
+        });
+        return scores || new Map();
+    }
+
+    function show(meta, total, records) {
+        results.textContent = '';
+        var summary = document.createElement('p');
+        summary.textContent = total + ' results' + (total > records.length ? ', showing the first ' + records.length : '');
+        results.appendChild(summary);
+        records.forEach(function (record) {
+            var item = document.createElement('div');
+            item.className = 'index-item';
+            var heading = document.createElement('h2');
+            var link = document.createElement('a');
+            link.href = record[0];
+            link.textContent = record[1];
+            heading.appendChild(link);
+            var info = document.createElement('div');
+            info.className = 'meta';
+            info.textContent = meta.collections[record[0].split('/')[0]] + ' | ' + record[2];
+            item.appendChild(heading);
+            item.appendChild(info);
+            results.appendChild(item);
+        });
+    }
+
+    function search(query) {
+        results.textContent = 'Searching...';
+        load('meta.json').then(function (meta) {
+            var wanted = terms(meta, query);
+            var shards = new Set(meta.shards);
+            return Promise.all(wanted.map(function (term) {
+                var name = shard(term);
+                if (!shards.has(name)) {
+                    return [];
+                }
+                return load('terms-' + name + '.json').then(function (terms) {
+                    return terms[term] || [];
+                });
+            })).then(function (postings) {
+                var scores = score(meta, postings);
+                var docs = Array.from(scores.keys()).sort(function (a, b) {
+                    return scores.get(b) - scores.get(a) || a - b;
+                });
+                var shown = docs.slice(0, MAX_RESULTS);
+                var chunks = Array.from(new Set(shown.map(function (doc) {
+                    return Math.floor(doc / meta.doc_chunk);
+                })));
+                return Promise.all(chunks.map(function (chunk) {
+                    return load('docs-' + chunk + '.json');
+                })).then(function (loaded) {
+                    var records = new Map();
+                    chunks.forEach(function (chunk, i) {
+                        records.set(chunk, loaded[i]);
+                    });
+                    show(meta, docs.length, shown.map(function (doc) {
+                        return records.get(Math.floor(doc / meta.doc_chunk))[doc % meta.doc_chunk];
+                    }));
+                });
+            });
+        }).catch(function (error) {
+            results.textContent = 'Search failed: ' + error.message;
+        });
+    }
+
+    form.addEventListener('submit', function (event) {
+        event.preventDefault();
+        history.replaceState(null, '', '?q=' + encodeURIComponent(input.value));
+        search(input.value);
+    });
+    var query = new URLSearchParams(window.location.search).get('q');
+    if (query) {
+        input.value = query;
+        search(query);
+    }
+})();
+"""
+        self.writer.write(os.path.join(self.html_path, 'search.js'), js.strip())
         
-        for topic in sorted_topics:
-            filename = self.sanitize_filename(topic['title']) + '.html'
-            created_date = self.format_date(topic['date'])
-            latest_date = self.format_date(topic['posts'][-1]['date']) if topic.get('posts') else created_date
-            
-            content.append(f'<div class="index-item">')
-            content.append(f'<h2><a href="{forum_dir}/{filename}">{topic["title"]}</a></h2>')
-            content.append(f'<div class="meta">')
-            content.append(f'Created: {created_date} by {topic["author"]} | ')
-            content.append(f'Last Activity: {latest_date}')
-            if topic.get('posts'):
-                content.append(f' | Replies: {len(topic["posts"]) - 1}')
-            content.append(f'</div>')
-            content.append(f'</div>')
-        
-        html = self.build_html_template(f'{forum_name} Archive', '\n'.join(content), nav_prefix='')
-        
-        index_path = os.path.join(self.html_path, f'{forum_dir}_index.html')
-        with open(index_path, 'w', encoding='utf-8') as f:
-            f.write(html)
-    
-    def build_main_index_html(self, blog_data, fvp_forum_data, general_forum_data):
+        index = self.search_index
+        print(f"Search index: {len(index.docs)} documents, {terms} terms in {shards} shards, "
+              f"{size / 1024:0.1f} KB; indexing took {index.seconds:0.05f} seconds, writing {tic.toc():0.05f} seconds")
+    
+    def build_main_index_html(self, views):
         """Build main index page"""
         content = []
         content.append('<h1>Mark Forster Archive</h1>')
@@ -992,328 +2839,894 @@ footer {
         
         content.append('<h2>Collections</h2>')
         content.append(f'<ul>')
-        content.append(f'<li><a href="blog_index.html">Blog</a> - {len(blog_data["posts"])} posts</li>')
-        content.append(f'<li><a href="fvp_forum_index.html">FVP Forum</a> - {len(fvp_forum_data["topics"])} topics</li>')
-        content.append(f'<li><a href="general_forum_index.html">General Forum</a> - {len(general_forum_data["topics"])} topics</li>')
+        for name, label, noun in [('blog', 'Blog', 'posts'), ('fvp_forum', 'FVP Forum', 'topics'), ('general_forum', 'General Forum', 'topics')]:
+            view = views[name]
+            content.append(f'<li><a href="{name}_index.html">{label}</a> - {len(view.items)} {noun}')
+            content.append(self.year_links('index.html', name, view))
+            content.append(f'</li>')
         content.append(f'</ul>')
         
         html = self.build_html_template('Mark Forster Archive', '\n'.join(content), nav_prefix='')
         
         index_path = os.path.join(self.html_path, 'index.html')
-        with open(index_path, 'w', encoding='utf-8') as f:
-            f.write(html)
-        
-    def sanitize_filename(self, title):
-        """Create a safe filename from a title"""
-        # Replace non-breaking spaces with regular spaces
-        safe = title.replace('\xa0', ' ')
-        # Remove or replace invalid characters
-        safe = re.sub(r'[<>:"/\\|?*#^]', '', safe)
-        safe = safe.strip()
-        # Limit length
-        if len(safe) > 200:
-            safe = safe[:200]
-        return safe
-    
-    def build_post_id_map(self, posts, subfolder=None):
-        """Build a mapping of URLs to post filenames (without .md extension)"""
-        post_map = {}
-        for post in posts:
-            # Map URL to the sanitized filename (with subfolder if provided)
-            filename = self.sanitize_filename(post['title'])
-            if subfolder:
-                filename = f"{subfolder}/{filename}"
-            post_map[post['url']] = filename
-        return post_map
-    
-    def build_topic_id_map(self, topics, subfolder=None):
-        """Build a mapping of URLs to topic filenames (without .md extension)"""
-        topic_map = {}
-        for topic in topics:
-            # Map URL to the sanitized filename (with subfolder if provided)
-            filename = self.sanitize_filename(topic['title'])
-            if subfolder:
-                filename = f"{subfolder}/{filename}"
-            topic_map[topic['url']] = filename
-        return topic_map
-    
-    def build_unified_id_map(self, blog_data, fvp_forum_data, general_forum_data):
-        """Build a unified mapping of all URLs across blog and forums"""
-        unified_map = {}
-        
-        # Add blog posts
-        unified_map.update(self.build_post_id_map(blog_data['posts'], 'Blog'))
-        
-        # Add FVP forum topics
-        unified_map.update(self.build_topic_id_map(fvp_forum_data['topics'], 'FVP Forum'))
-        
-        # Add General forum topics
-        unified_map.update(self.build_topic_id_map(general_forum_data['topics'], 'General Forum'))
-        
-        return unified_map
-    
-    def html_to_markdown(self, html, base_url, post_id_map):
-        """Convert HTML to Markdown"""
-        parser = HTML2MarkdownParser(base_url, post_id_map)
-        parser.feed(html)
-        return parser.get_markdown()
-    
-    def format_date(self, date_obj):
-        """Format date object to readable string"""
-        return f"{date_obj['year']}-{date_obj['month']}-{date_obj['day']} {date_obj.get('time', '00:00')}"
+        self.writer.write(index_path, html)
 
-    def create_blog_index(self, posts):
-        """Create an index file listing all blog posts in reverse chronological order"""
-        md = []
-        
-        md.append('# Blog Archive')
-        md.append('')
-        md.append(f'Total posts: {len(posts)}')
-        md.append('')
-        
-        # Sort posts by date (reverse chronological)
-        sorted_posts = sorted(posts, key=lambda p: (
-            int(p['date']['year']),
-            int(p['date']['month']),
-            int(p['date']['day']),
-            p['date'].get('time', '00:00')
-        ), reverse=True)
-        
-        for post in sorted_posts:
-            filename = self.sanitize_filename(post['title'])
-            date_str = self.format_date(post['date'])
-            
-            # Create entry with wiki link
-            md.append(f"- [[Blog/{filename}|{post['title']}]] - *{date_str}*")
-            
-            # Add tags if present
-            if post.get('tags'):
-                md.append(f"  - Tags: {', '.join(['#'+self.sanitize_tag(t) for t in post['tags']])}")
-        
-        # Write index file
-        index_path = os.path.join(self.vault_path, 'Blog Archive.md')
-        with open(index_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(md))
-        
-        print(f"Created blog archive index at {index_path}")
-    
-    def sanitize_tag(self, tag):
-        safe = re.sub(r'[ ]', '', tag)
-        return safe
+class DataStore:
+    # First line of every parsed-file cache; bump the version when the format changes
+    CACHE_MAGIC = b'markforster-archive-cache 1\n'
+    INDEX_VERSION = 2
+    # Key of the array of posts/topics in each raw file
+    ITEM_KEYS = {'blog': 'posts', 'general_forum': 'topics', 'fvp_forum': 'topics'}
 
-    def build_blog_post(self, post, post_id_map, base_url):
-        """Convert a single blog post to markdown"""
-        md = []
-        
-        # Frontmatter
-        md.append('---')
-        md.append(f"id: {post['id']}")
-        md.append(f"title: \"{post['title']}\"")
-        md.append(f"date: {self.format_date(post['date'])}")
-        md.append(f"url: {post['url']}")
-        if post.get('tags'):
-            md.append(f"tags: [{', '.join([self.sanitize_tag(t) for t in post['tags']])}]")
-        md.append('---')
-        md.append('')
-        
-        # Title
-        md.append(f"# {post['title']}")
-        md.append('')
-        
-        # Date
-        md.append(f"*Posted: {self.format_date(post['date'])}*")
-        md.append('')
-        
-        # Body
-        body_md = self.html_to_markdown(post['body'], base_url, post_id_map)
-        md.append(body_md)
-        md.append('')
-        
-        # Comments
-        if post.get('comments'):
-            md.append('---')
-            md.append('')
-            md.append(f"## Comments ({len(post['comments'])})")
-            md.append('')
-            
-            for comment in post['comments']:
-                md.append(f"### {comment['author']} - {self.format_date(comment['date'])}")
-                md.append('')
-                md.append(self.html_to_markdown(comment['body'], base_url, post_id_map))
-                md.append('')
-        
-        return '\n'.join(md)
-    
-    def build_blog_vault(self, blog_data, unified_id_map):
-        """Build vault from blog posts"""
-        posts = blog_data['posts']
-        base_url = posts[0]['url'] if posts else 'http://markforster.squarespace.com'
-        
-        for post in posts:
-            # Create filename from title
-            filename = self.sanitize_filename(post['title']) + '.md'
-            filepath = os.path.join(self.blog_path, filename)
-            
-            # Generate markdown
-            markdown = self.build_blog_post(post, unified_id_map, base_url)
-            
-            # Write file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(markdown)
-        
-        # Create blog archive index
-        self.create_blog_index(posts)
-        print(f"Created {len(posts)} blog post files in {self.blog_path}")
-    
-    def get_latest_post_date(self, topic):
-        """Get the date of the most recent post in a topic"""
-        if not topic.get('posts'):
-            # Fallback to topic creation date if no posts
-            return (
-                int(topic['date']['year']),
-                int(topic['date']['month']),
-                int(topic['date']['day']),
-                topic['date'].get('time', '00:00')
-            )
-        
-        # Get the last post's date (posts should be in chronological order)
-        last_post = topic['posts'][-1]
-        return (
-            int(last_post['date']['year']),
-            int(last_post['date']['month']),
-            int(last_post['date']['day']),
-            last_post['date'].get('time', '00:00')
-        )
-    
-    def build_forum_topic(self, topic, topic_id_map, base_url):
-        """Convert a single forum topic to markdown"""
-        md = []
+    def __init__(self, conf, use_cache=True):
+        self.conf = conf
+        self.root = conf['root']
+        self.raw_archive = os.path.join(self.root, conf['local.storage']['raw'])
+        self.validators_path = os.path.join(self.raw_archive, 'validators.json')
+        self.cache_path = os.path.join(self.root, conf['local.storage'].get('cache', 'cache'))
+        self.use_cache = use_cache
+        os.makedirs(self.raw_archive, exist_ok=True)
+
+    def load_validators(self):
+        """Load the ETag/Last-Modified values recorded for each raw file"""
+        if os.path.exists(self.validators_path):
+            return load_json(self.validators_path)
+        return {}
+
+    def save_validators(self, validators):
+        with open(self.validators_path, 'w', encoding='utf-8') as f:
+            json.dump(validators, f, indent=4)
+
+    def update_archive(self, fetcher=None):
+        remote_files = self.conf['remote.raw_files']
+        local_files = self.conf['local.raw_files']
+        validators = self.load_validators()
+        fetcher = fetcher or RawFileFetcher()
+
+        files = {}
+        for f in remote_files:
+            local = os.path.join(self.raw_archive, local_files[f])
+            files[f] = (remote_files[f], local, validators.get(f))
+        results, errors = fetcher.fetch_all(files)
+
+        for f in remote_files:
+            if f in results:
+                if results[f]['modified']:
+                    validators[f] = results[f]['validators']
+                print(f"{f}: {format_transfer(results[f])}")
+            else:
+                print(f"{f}: failed ({errors[f]})")
+        self.save_validators(validators)
+
+        if errors:
+            raise next(iter(errors.values()))
+
+    def load_raw_file(self, f):
+        path = os.path.join(self.raw_archive, self.conf['local.raw_files'][f])
+        if not self.use_cache:
+            return load_json(path)
+
+        cache_file = os.path.join(self.cache_path, self.conf['local.raw_files'][f] + '.cache')
+        stat = os.stat(path)
+        data = self.read_cache(cache_file, path, stat)
+        if data is None:
+            data = load_json(path)
+            self.write_cache(cache_file, data, path, stat)
+        return data
+
+    def iter_items(self, f):
+        """Stream the posts/topics of a raw file one at a time"""
+        for item, _, _ in self.iter_raw_items(f):
+            yield item
+
+    def iter_raw_items(self, f):
+        """Stream (item, start, end) for each post/topic of a raw file, with byte offsets"""
+        path = os.path.join(self.raw_archive, self.conf['local.raw_files'][f])
+        with open(path, 'rb') as fh:
+            yield from iter_array_items(fh, self.ITEM_KEYS[f])
+
+    def stream_raw_file(self, f):
+        """Load a raw file in streaming mode; see StreamedRawFile"""
+        return StreamedRawFile(self, f)
+
+    def build_index(self, f):
+        """Record the id, url, title, byte span and date of every post/topic in a raw file"""
+        path = os.path.join(self.raw_archive, self.conf['local.raw_files'][f])
+        stat = os.stat(path)
+        items = []
+        for item, start, end in self.iter_raw_items(f):
+            items.append([item.get('id'), item['url'], item['title'], start, end, item.get('date')])
+
+        index = self.fingerprint(path, stat)
+        index.update({'version': self.INDEX_VERSION, 'items': items})
+        os.makedirs(self.cache_path, exist_ok=True)
+        with open(self.index_path(f), 'w', encoding='utf-8') as fh:
+            fh.write(json.dumps(index, ensure_ascii=False))
+        return index
+
+    def index_path(self, f):
+        return os.path.join(self.cache_path, self.conf['local.raw_files'][f] + '.index.json')
+
+    def load_index(self, f):
+        """Load the offset index of a raw file, rebuilding it if the file changed"""
+        path = os.path.join(self.raw_archive, self.conf['local.raw_files'][f])
+        try:
+            index = load_json(self.index_path(f))
+            if index.get('version') == self.INDEX_VERSION and self.source_unchanged(index, path, os.stat(path)):
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+        return self.build_index(f)
+
+    def find_item(self, indexes, url=None, item_id=None):
+        """Find the index entry of a post/topic by url or id, returning (f, entry)"""
+        for f, index in indexes.items():
+            for entry in index['items']:
+                if (url is not None and entry[1] == url) or (item_id is not None and str(entry[0]) == item_id):
+                    return f, entry
+        return None
+
+    def load_item(self, f, entry):
+        """Parse a single post/topic from its byte span in a memory-mapped raw file"""
+        path = os.path.join(self.raw_archive, self.conf['local.raw_files'][f])
+        start, end = entry[3], entry[4]
+        with open(path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return json.loads(mm[start:end])
+
+    def fingerprint(self, path, stat):
+        return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': file_sha1(path)}
+
+    def source_unchanged(self, header, path, stat):
+        """Check a recorded fingerprint against a raw file
+
+        The file is unchanged when its size and mtime match, or when only the
+        mtime differs but its SHA-1 still matches.
+        """
+        if header['size'] != stat.st_size:
+            return False
+        return header['mtime'] == stat.st_mtime_ns or header['sha1'] == file_sha1(path)
+
+    def read_cache(self, cache_file, path, stat):
+        """Load the parsed form of a raw file from its cache if it is still valid"""
+        try:
+            with open(cache_file, 'rb') as f:
+                if f.readline() != self.CACHE_MAGIC:
+                    return None
+                if not self.source_unchanged(json.loads(f.readline()), path, stat):
+                    return None
+                return pickle.load(f)
+        except (OSError, ValueError, KeyError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def write_cache(self, cache_file, data, path, stat):
+        """Store the parsed form of a raw file, keyed by the source's size, mtime and hash"""
+        os.makedirs(self.cache_path, exist_ok=True)
+        header = self.fingerprint(path, stat)
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(self.CACHE_MAGIC)
+            f.write(json.dumps(header).encode('ascii') + b'\n')
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+
+
+class StreamedRawFile(dict):
+    """A raw file loaded in two passes to keep memory use bounded
+
+    It looks like a loaded raw file, but its posts/topics are summaries
+    without HTML bodies, enough for link maps and index pages. iter_items()
+    streams the complete items from disk one at a time for rendering.
+    """
+
+    def __init__(self, datastore, f):
+        self.datastore = datastore
+        self.f = f
+        self.key = datastore.ITEM_KEYS[f]
+        super().__init__({self.key: [strip_bodies(item) for item in datastore.iter_items(f)]})
+
+    def iter_items(self):
+        # Follow the summaries, which may have been truncated (--max_posts)
+        return itertools.islice(self.datastore.iter_items(self.f), len(self[self.key]))
+
+
+def full_items(data, key):
+    """The complete posts/topics of a loaded or streamed raw file"""
+    if isinstance(data, StreamedRawFile):
+        return map(Item, data.iter_items())
+    return data[key]
+
+
+def date_sort_key(date_obj):
+    return (int(date_obj['year']), int(date_obj['month']), int(date_obj['day']), date_obj.get('time', '00:00'))
+
+def format_date(date_obj):
+    """Format date object to readable string"""
+    return f"{date_obj['year']}-{date_obj['month']}-{date_obj['day']} {date_obj.get('time', '00:00')}"
+
+def intern_name(name):
+    """Share one copy of an author or tag name between all items"""
+    return sys.intern(name) if name else name
+
+
+class Reply:
+    """A comment on a blog post or a post in a forum topic"""
+    __slots__ = ('author', 'body', 'sort_key', 'date')
+
+    def __init__(self, raw):
+        self.author = intern_name(raw.get('author'))
+        self.body = raw.get('body')
+        self.sort_key = date_sort_key(raw['date'])
+        self.date = format_date(raw['date'])
+
+
+class Item:
+    """A blog post or forum topic as the builders use it
+
+    The values the builders derive from the raw JSON are computed once: the
+    output filename (slug), the formatted date and sort key, and those of
+    the latest reply. The replies are a post's comments or a topic's posts,
+    the first of which is the original post.
+    """
+    __slots__ = ('id', 'url', 'title', 'author', 'tags', 'body', 'replies',
+                 'slug', 'sort_key', 'date', 'activity_key', 'activity_date')
+
+    def __init__(self, raw):
+        self.id = raw.get('id')
+        self.url = raw['url']
+        self.title = raw['title']
+        self.author = intern_name(raw.get('author'))
+        self.tags = tuple(intern_name(tag) for tag in raw.get('tags') or ())
+        self.body = raw.get('body')
+        self.replies = tuple(Reply(reply) for reply in raw.get('comments') or raw.get('posts') or ())
+        self.slug = ObsidianVaultBuilder.sanitize_filename(self.title)
         
-        # Frontmatter
-        md.append('---')
-        md.append(f"id: {topic['id']}")
-        md.append(f"title: \"{topic['title']}\"")
-        md.append(f"date: {self.format_date(topic['date'])}")
-        md.append(f"author: {topic['author']}")
-        md.append(f"url: {topic['url']}")
-        if topic.get('tags'):
-            md.append(f"tags: [{', '.join([self.sanitize_tag(t) for t in topic['tags']])}]")
-        md.append('---')
-        md.append('')
+        # Stubs built from an index have no date
+        date = raw.get('date')
+        self.sort_key = date_sort_key(date) if date else None
+        self.date = format_date(date) if date else None
+        latest = self.replies[-1] if self.replies else self
+        self.activity_key = latest.sort_key
+        self.activity_date = latest.date
+
+    def fields(self):
+        """The item's fields as strings, for hashing"""
+        fields = [str(self.id), self.url, self.title, str(self.author), '\x1f'.join(self.tags), str(self.date), str(self.body)]
+        for reply in self.replies:
+            fields += (str(reply.author), reply.date, str(reply.body))
+        return fields
+
+
+def normalize_items(data, key):
+    """Replace the raw posts/topics of a loaded raw file with Items"""
+    data[key] = [Item(item) for item in data[key]]
+
+
+class SQLiteDataStore(DataStore):
+    """DataStore backed by an SQLite database imported from the raw files
+
+    Posts and topics, their comments/replies and their tags are kept in
+    normalized tables with indexes on url, id, date and author.
+    update_archive imports raw files that changed, and loading imports them
+    on demand if the database is behind. Loaded files are SQLiteRawFile
+    objects, which answer index-page orderings with indexed queries.
+    """
+    SCHEMA_VERSION = 1
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sources (
+            name TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime INTEGER NOT NULL,
+            sha1 TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS items (
+            pk INTEGER PRIMARY KEY,
+            source TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            id TEXT,
+            url TEXT,
+            title TEXT,
+            author TEXT,
+            date TEXT,
+            year INTEGER,
+            month INTEGER,
+            day INTEGER,
+            time TEXT,
+            activity_year INTEGER,
+            activity_month INTEGER,
+            activity_day INTEGER,
+            activity_time TEXT,
+            body TEXT,
+            reply_key TEXT,
+            has_tags INTEGER NOT NULL,
+            extra TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS replies (
+            item INTEGER NOT NULL REFERENCES items(pk),
+            position INTEGER NOT NULL,
+            author TEXT,
+            date TEXT,
+            year INTEGER,
+            month INTEGER,
+            day INTEGER,
+            time TEXT,
+            body TEXT,
+            extra TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tags (
+            item INTEGER NOT NULL REFERENCES items(pk),
+            position INTEGER NOT NULL,
+            tag TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS items_position ON items(source, position);
+        CREATE INDEX IF NOT EXISTS items_url ON items(url);
+        CREATE INDEX IF NOT EXISTS items_id ON items(id);
+        CREATE INDEX IF NOT EXISTS items_author ON items(author);
+        CREATE INDEX IF NOT EXISTS items_date ON items(source, year, month, day, time, position);
+        CREATE INDEX IF NOT EXISTS items_activity ON items(source, activity_year, activity_month, activity_day, activity_time, position);
+        CREATE INDEX IF NOT EXISTS replies_item ON replies(item, position);
+        CREATE INDEX IF NOT EXISTS replies_author ON replies(author);
+        CREATE INDEX IF NOT EXISTS replies_date ON replies(year, month, day, time);
+        CREATE INDEX IF NOT EXISTS tags_item ON tags(item, position);
+        CREATE INDEX IF NOT EXISTS tags_tag ON tags(tag);
+    """
+    # Columns holding a field of the raw item directly
+    ITEM_FIELDS = ('id', 'url', 'title', 'author', 'body')
+    REPLY_FIELDS = ('author', 'body')
+    ORDERS = {
+        'date': 'year DESC, month DESC, day DESC, time DESC, position',
+        'activity': 'activity_year DESC, activity_month DESC, activity_day DESC, activity_time DESC, position',
+    }
+
+    def __init__(self, conf, use_cache=True):
+        super().__init__(conf, use_cache)
+        self.db_path = os.path.join(self.root, conf['local.storage'].get('sqlite', 'archive.sqlite'))
+        self.connections = threading.local()
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+            for table in ('tags', 'replies', 'items', 'sources'):
+                self.db.execute(f'DROP TABLE IF EXISTS {table}')
+            self.db.executescript(self.SCHEMA)
+            self.db.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+    @property
+    def db(self):
+        """Connection to the database for the current thread"""
+        if not hasattr(self.connections, 'db'):
+            self.connections.db = sqlite3.connect(self.db_path)
+        return self.connections.db
+
+    def update_archive(self, fetcher=None):
+        super().update_archive(fetcher)
+        for f in self.conf['local.raw_files']:
+            self.import_raw_file(f)
+
+    def import_raw_file(self, f):
+        """(Re)import a raw file into the database unless it is unchanged, returning whether it was"""
+        path = os.path.join(self.raw_archive, self.conf['local.raw_files'][f])
+        stat = os.stat(path)
+        row = self.db.execute('SELECT size, mtime, sha1 FROM sources WHERE name = ?', (f,)).fetchone()
+        if row and self.source_unchanged(dict(zip(('size', 'mtime', 'sha1'), row)), path, stat):
+            return False
+
+        with self.db:
+            old_items = 'SELECT pk FROM items WHERE source = ?'
+            self.db.execute(f'DELETE FROM tags WHERE item IN ({old_items})', (f,))
+            self.db.execute(f'DELETE FROM replies WHERE item IN ({old_items})', (f,))
+            self.db.execute('DELETE FROM items WHERE source = ?', (f,))
+            for position, item in enumerate(super().iter_items(f)):
+                self.insert_item(f, position, item)
+            fingerprint = self.fingerprint(path, stat)
+            self.db.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)',
+                            (f, fingerprint['size'], fingerprint['mtime'], fingerprint['sha1']))
+        print(f"Imported {f} into {self.db_path}")
+        return True
+
+    def insert_item(self, f, position, item):
+        reply_key = 'comments' if 'comments' in item else 'posts' if 'posts' in item else None
+        replies = item.get(reply_key) or []
+        date = item.get('date')
+        activity = replies[-1]['date'] if replies else date
+        extra = {k: v for k, v in item.items() if k not in self.ITEM_FIELDS + ('date', 'tags', reply_key)}
+
+        columns = [f, position] + [item.get(k) for k in self.ITEM_FIELDS]
+        columns.append(json.dumps(date) if date is not None else None)
+        columns.extend(date_sort_key(date) if date is not None else (None,) * 4)
+        columns.extend(date_sort_key(activity) if activity is not None else (None,) * 4)
+        columns.extend([reply_key, 'tags' in item, json.dumps(extra)])
+        pk = self.db.execute(
+            'INSERT INTO items (source, position, id, url, title, author, body, date, year, month, day, time, '
+            'activity_year, activity_month, activity_day, activity_time, reply_key, has_tags, extra) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', columns).lastrowid
+
+        for i, reply in enumerate(replies):
+            reply_date = reply.get('date')
+            extra = {k: v for k, v in reply.items() if k not in self.REPLY_FIELDS + ('date',)}
+            self.db.execute(
+                'INSERT INTO replies VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [pk, i, reply.get('author'), json.dumps(reply_date) if reply_date is not None else None]
+                + list(date_sort_key(reply_date) if reply_date is not None else (None,) * 4)
+                + [reply.get('body'), json.dumps(extra)])
+        self.db.executemany('INSERT INTO tags VALUES (?, ?, ?)',
+                            [(pk, i, tag) for i, tag in enumerate(item.get('tags') or [])])
+
+    def iter_items(self, f):
+        """Stream the posts/topics of a raw file from the database"""
+        self.import_raw_file(f)
+        rows = self.db.execute(
+            'SELECT pk, id, url, title, author, body, date, reply_key, has_tags, extra '
+            'FROM items WHERE source = ? ORDER BY position', (f,))
+        for pk, *fields, date, reply_key, has_tags, extra in rows:
+            item = json.loads(extra)
+            item.update((k, v) for k, v in zip(self.ITEM_FIELDS, fields) if v is not None)
+            if date is not None:
+                item['date'] = json.loads(date)
+            if has_tags:
+                item['tags'] = [tag for tag, in self.db.execute(
+                    'SELECT tag FROM tags WHERE item = ? ORDER BY position', (pk,))]
+            if reply_key:
+                item[reply_key] = [self.make_reply(*row) for row in self.db.execute(
+                    'SELECT author, body, date, extra FROM replies WHERE item = ? ORDER BY position', (pk,))]
+            yield item
+
+    def make_reply(self, author, body, date, extra):
+        reply = json.loads(extra)
+        reply.update((k, v) for k, v in zip(self.REPLY_FIELDS, (author, body)) if v is not None)
+        if date is not None:
+            reply['date'] = json.loads(date)
+        return reply
+
+    def load_raw_file(self, f):
+        return SQLiteRawFile(self, f, list(self.iter_items(f)))
+
+    def ordered_positions(self, f, order):
+        """Positions of the items of a raw file, newest first by creation date or last activity"""
+        rows = self.db.execute(f'SELECT position FROM items WHERE source = ? ORDER BY {self.ORDERS[order]}', (f,))
+        return [position for position, in rows]
+
+
+class SQLiteRawFile(dict):
+    """A raw file loaded from SQLiteDataStore, able to order its items by query"""
+
+    def __init__(self, datastore, f, items):
+        self.datastore = datastore
+        self.f = f
+        self.key = datastore.ITEM_KEYS[f]
+        super().__init__({self.key: items})
+
+    def ordered(self, order):
+        # Follow the item list, which may have been truncated (--max_posts)
+        items = self[self.key]
+        return [items[p] for p in self.datastore.ordered_positions(self.f, order) if p < len(items)]
+
+
+def presorted(data, order):
+    """Items of a raw file ordered by 'date' or 'activity' if its backend can do so, else None"""
+    if isinstance(data, SQLiteRawFile):
+        return data.ordered(order)
+    return None
+
+
+class CollectionView:
+    """The orderings and groupings of a blog or forum shared by every index page
+
+    Items are ordered newest first by date and by latest activity, and the
+    date ordering is grouped by year and by month in the same order.
+    """
+    def __init__(self, data, key):
+        self.items = data[key]
+        self.by_date = presorted(data, 'date')
+        if self.by_date is None:
+            self.by_date = sorted(self.items, key=lambda item: item.sort_key, reverse=True)
+        self.by_activity = presorted(data, 'activity')
+        if self.by_activity is None:
+            self.by_activity = sorted(self.items, key=lambda item: item.activity_key, reverse=True)
         
-        # Title
-        md.append(f"# {topic['title']}")
-        md.append('')
+        # One pass over the date ordering keeps each group newest first
+        self.months = {}
+        self.years = {}
+        for item in self.by_date:
+            year, month = item.sort_key[:2]
+            self.months.setdefault((year, month), []).append(item)
+            self.years.setdefault(year, []).append(item)
+
+
+def collection_views(blog_data, fvp_forum_data, general_forum_data):
+    """Views of the blog and both forums, keyed like the raw files"""
+    return {
+        'blog': CollectionView(blog_data, 'posts'),
+        'fvp_forum': CollectionView(fvp_forum_data, 'topics'),
+        'general_forum': CollectionView(general_forum_data, 'topics'),
+    }
+
+
+def make_datastore(conf, args):
+    """Create the DataStore for the backend selected on the command line"""
+    if args.backend == 'sqlite':
+        return SQLiteDataStore(conf, use_cache=not args.no_cache)
+    return DataStore(conf, use_cache=not args.no_cache)
+
+def make_body_cache(ds, args):
+    """Create the parsed body cache, kept next to the DataStore's raw file cache
+
+    Streaming builds keep memory bounded, so they get no cache at all.
+    """
+    if args.stream:
+        return None
+    if args.no_cache:
+        return BodyCache(parser=args.parser)
+    return BodyCache(os.path.join(ds.cache_path, 'bodies.cache'), args.parser)
+
+
+class LinkIndex(dict):
+    """Link targets of the archived items, keyed by canonical URL
+
+    Links in the archive point at items in many forms: over https, through
+    the alternative roots, relative to the site, with a trailing slash, a
+    fragment or a query. All of them reduce to the same key: the path of the
+    URL on the site, so get() resolves any of them with one lookup.
+    """
+
+    def __init__(self, conf, link_map):
+        source = conf.get('source', {})
+        roots = [source.get('canonical_root', '')] + source.get('alternative_roots', [])
+        self.hosts = {urlsplit(root).netloc.lower() for root in roots if root}
+        self.hosts.update(urlsplit(url).netloc.lower() for url in link_map)
+        self.keys = {}
+        super().__init__()
+        for url, target in link_map.items():
+            key = self.canonical(url)
+            if key is not None:
+                self[key] = target
+
+    def canonical(self, url):
+        """Key of a URL on the archived site, or None if it points elsewhere"""
+        key = self.keys.get(url)
+        if key is None and url not in self.keys:
+            key = self.keys[url] = self.make_key(url)
+        return key
+
+    def make_key(self, url):
+        try:
+            parts = urlsplit(url.strip())
+        except ValueError:
+            return None
+        if parts.scheme not in ('', 'http', 'https'):
+            return None
+        if parts.netloc:
+            if parts.netloc.lower() not in self.hosts:
+                return None
+        elif parts.scheme or not parts.path.startswith('/'):
+            return None
+        return parts.path.rstrip('/') or '/'
+
+    def get(self, url, default=None):
+        key = self.canonical(url)
+        if key is None:
+            return default
+        return super().get(key, default)
+
+
+class ItemRegistry:
+    """Output names of every post and topic, shared by the vault and HTML builders
+
+    Both the vault's id map and the HTML site's url map are derived from
+    the items' slugs.
+    """
+    # (raw file, item key, vault folder, HTML directory)
+    COLLECTIONS = [
+        ('blog', 'posts', 'Blog', 'blog'),
+        ('fvp_forum', 'topics', 'FVP Forum', 'fvp_forum'),
+        ('general_forum', 'topics', 'General Forum', 'general_forum'),
+    ]
+
+    def __init__(self, blog_data, fvp_forum_data, general_forum_data, shard=None):
+        data = {'blog': blog_data, 'fvp_forum': fvp_forum_data, 'general_forum': general_forum_data}
+        self.root = item_page_root(shard)
+        self.entries = []
+        for f, key, folder, html_dir in self.COLLECTIONS:
+            for item in data[f][key]:
+                self.entries.append((item.url, folder, html_dir, shard_folder(item.sort_key, shard) + item.slug))
+
+    def unified_id_map(self):
+        """Map of URLs to vault note names, as ObsidianVaultBuilder.build_unified_id_map"""
+        return {url: f"{folder}/{filename}" for url, folder, _, filename in self.entries}
+
+    def unified_url_map(self):
+        """Map of URLs to HTML pages, as HTMLSiteBuilder.build_unified_url_map"""
+        return {url: f'{self.root}{html_dir}/{filename}.html' for url, _, html_dir, filename in self.entries}
+
+
+class ArchivePipeline:
+    """Builds the vault and the HTML site from already loaded data, without the command line
+
+    The raw files are passed as loaded, e.g. by DataStore.load_raw_file, and
+    options are the build commands' options by name, e.g. jobs=4 or
+    lazy_comments=20. Each build returns the writer it wrote through, made
+    by calling make_writer with the output path; by default that is a
+    MemoryWriter, so nothing touches the filesystem:
+
+        pipeline = ArchivePipeline(conf, blog_data, fvp_forum_data, general_forum_data, page_size=50)
+        pages = pipeline.build_html().files
+
+    Pass functools.partial(output_writer, 'dir') to write to disk instead.
+    """
+    
+    def __init__(self, conf, blog_data, fvp_forum_data, general_forum_data, **options):
+        parser = argparse.ArgumentParser()
+        build_all_parser(parser)
+        self.args = parser.parse_args([])
+        for name, value in options.items():
+            if not hasattr(self.args, name):
+                raise TypeError(f"unknown build option {name!r}")
+            setattr(self.args, name, value)
+        self.conf = conf
+        # The caller's data is left as it was; the builds use copies holding Items
+        self.data = []
+        for data, (_, key, _, _) in zip((blog_data, fvp_forum_data, general_forum_data), ItemRegistry.COLLECTIONS):
+            if data[key] and not isinstance(data[key][0], Item):
+                data = {**data, key: [Item(item) for item in data[key]]}
+            self.data.append(data)
+        self.registry = ItemRegistry(*self.data, shard=self.args.shard)
+        self.views = collection_views(*self.data)
+    
+    def build_vault(self, make_writer=MemoryWriter, body_cache=None):
+        return vault_from_data(self.conf, self.args, *self.data, self.registry.unified_id_map(), body_cache, self.views, make_writer)
+    
+    def build_html(self, make_writer=MemoryWriter):
+        return html_from_data(self.conf, self.args, *self.data, self.registry.unified_url_map(), self.views, make_writer)
+
+
+class ArchiveSearchIndex:
+    """On-disk inverted index of the raw archive, ranked with BM25
+
+    The index is a single file: a magic line, a JSON header line and then
+    flat arrays of native unsigned integers and UTF-8 blobs at the offsets
+    the header gives. Searching memory-maps the file and binary searches the
+    sorted term table, so only the postings of the query's terms and the
+    records of the results are read.
+
+    Terms and their weights are those of the HTML site's search index
+    (SearchIndex.term_weights). Each document is a post or topic, recorded
+    with its collection, date (as YYYYMMDD), the ids of everyone who wrote
+    in it and the path of its vault note.
+    """
+    MAGIC = b'markforster-search-index 1\n'
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, path):
+        self.path = path
+        self.fh = open(path, 'rb')
+        try:
+            if self.fh.readline() != self.MAGIC:
+                raise ValueError(f"{path} is not a search index; run build_search_index")
+            self.header = json.loads(self.fh.readline())
+            self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.fh.close()
+            raise
+        if self.header['byteorder'] != sys.byteorder:
+            raise ValueError(f"{path} was built on a machine with a different byte order")
         
-        # Topic info
-        md.append(f"**Author:** {topic['author']}")
-        md.append(f"**Created:** {self.format_date(topic['date'])}")
-        if topic.get('posts'):
-            last_post_date = self.format_date(topic['posts'][-1]['date'])
-            md.append(f"**Last Activity:** {last_post_date}")
-        md.append('')
-        md.append('---')
-        md.append('')
+        view = memoryview(self.mm)
+        self.arrays = {}
+        for name, (typecode, offset, length) in self.header['arrays'].items():
+            self.arrays[name] = view[offset:offset + length]
+            if typecode != 'B':
+                self.arrays[name] = self.arrays[name].cast(typecode)
+        self.authors = {name.lower(): i for i, name in enumerate(self.header['authors'])}
+
+    def close(self):
+        for array_view in self.arrays.values():
+            array_view.release()
+        self.mm.close()
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @classmethod
+    def build(cls, ds, path):
+        """Index every post and topic of the data store's raw files, returning the header"""
+        docs = {'length': array.array('I'), 'date': array.array('I'), 'collection': array.array('B'),
+                'record_offsets': array.array('Q', [0]), 'author_offsets': array.array('Q', [0])}
+        records = bytearray()
+        author_ids = array.array('I')
+        authors = {}
+        postings = {}
+        collection_names = []
+        sources = {}
         
-        # Posts
-        if topic.get('posts'):
-            for i, post in enumerate(topic['posts']):
-                # First post is the topic body
-                if i == 0:
-                    md.append('## Original Post')
-                    md.append('')
-                else:
-                    md.append(f"## Reply by {post['author']}")
-                    md.append('')
+        for c, (f, key, folder, _) in enumerate(ItemRegistry.COLLECTIONS):
+            collection_names.append([f, folder])
+            raw_path = os.path.join(ds.raw_archive, ds.conf['local.raw_files'][f])
+            sources[f] = ds.fingerprint(raw_path, os.stat(raw_path))
+            for raw in ds.iter_items(f):
+                item = Item(raw)
+                doc = len(docs['length'])
+                weights = SearchIndex.term_weights(item)
+                for term, weight in weights.items():
+                    entries = postings.get(term)
+                    if entries is None:
+                        entries = postings[term] = array.array('I')
+                    entries.append(doc)
+                    entries.append(weight)
                 
-                md.append(f"*{self.format_date(post['date'])}*")
-                md.append('')
+                docs['length'].append(sum(weights.values()))
+                year, month, day = item.sort_key[:3] if item.sort_key else (0, 0, 0)
+                docs['date'].append(year * 10000 + month * 100 + day)
+                docs['collection'].append(c)
+                record = [f"{folder}/{item.slug}.md", unescape(item.title), item.date, item.url]
+                records += json.dumps(record, ensure_ascii=False).encode('utf-8')
+                docs['record_offsets'].append(len(records))
                 
-                # Convert body to markdown
-                body_md = self.html_to_markdown(post['body'], base_url, topic_id_map)
-                md.append(body_md)
-                md.append('')
-                md.append('---')
-                md.append('')
+                writers = dict.fromkeys(name for name in [item.author] + [reply.author for reply in item.replies] if name)
+                author_ids.extend(sorted(authors.setdefault(name, len(authors)) for name in writers))
+                docs['author_offsets'].append(len(author_ids))
         
-        return '\n'.join(md)
-    
-    def create_forum_index(self, topics, forum_name, output_path):
-        """Create an index file listing all forum topics sorted by last activity"""
-        md = []
+        # Terms sorted by their UTF-8 bytes, which is how the search compares them
+        terms = sorted(term.encode('utf-8') for term in postings)
+        term_blob = bytearray()
+        term_offsets = array.array('Q', [0])
+        posting_offsets = array.array('Q', [0])
+        posting_docs = array.array('I')
+        posting_weights = array.array('I')
+        for term in terms:
+            entries = postings.pop(term.decode('utf-8'))
+            term_blob += term
+            term_offsets.append(len(term_blob))
+            posting_docs.extend(entries[0::2])
+            posting_weights.extend(entries[1::2])
+            posting_offsets.append(len(posting_docs))
         
-        md.append(f'# {forum_name} Archive')
-        md.append('')
-        md.append(f'Total topics: {len(topics)}')
-        md.append('')
+        sections = [
+            ('doc_length', docs['length']), ('doc_date', docs['date']), ('doc_collection', docs['collection']),
+            ('record_offsets', docs['record_offsets']), ('records', bytes(records)),
+            ('author_offsets', docs['author_offsets']), ('author_ids', author_ids),
+            ('term_offsets', term_offsets), ('terms', bytes(term_blob)),
+            ('posting_offsets', posting_offsets), ('posting_docs', posting_docs), ('posting_weights', posting_weights),
+        ]
+        doc_count = len(docs['length'])
+        header = {
+            'byteorder': sys.byteorder,
+            'docs': doc_count,
+            'terms': len(terms),
+            'average_length': sum(docs['length']) / doc_count if doc_count else 0,
+            'collections': collection_names,
+            'authors': sorted(authors, key=authors.get),
+            'sources': sources,
+            'arrays': {},
+        }
         
-        # Sort topics by most recent post date (reverse chronological)
-        sorted_topics = sorted(topics, key=self.get_latest_post_date, reverse=True)
-        
-        for topic in sorted_topics:
-            filename = self.sanitize_filename(topic['title'])
-            created_date = self.format_date(topic['date'])
-            latest_date = self.format_date(topic['posts'][-1]['date']) if topic.get('posts') else created_date
-            
-            # Create entry with wiki link
-            md.append(f"- [[{forum_name}/{filename}|{topic['title']}]]")
-            md.append(f"  - Created: *{created_date}* by {topic['author']}")
-            md.append(f"  - Last Activity: *{latest_date}*")
-            if topic.get('posts'):
-                md.append(f"  - Replies: {len(topic['posts']) - 1}")
-            
-            # Add tags if present
-            if topic.get('tags'):
-                md.append(f"  - Tags: {', '.join(['#'+self.sanitize_tag(t) for t in topic['tags']])}")
-        
-        # Write index file
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(md))
-        
-        print(f"Created {forum_name} index at {output_path}")
-    
-    def build_forum_vault(self, forum_data, forum_name, forum_path, base_url, unified_id_map):
-        """Build vault from forum topics"""
-        topics = forum_data['topics']
+        # The header gives the offsets of the arrays, which depend on the header's own
+        # length; reserve room for the offsets first, then fill them in
+        data_start = 0
+        while True:
+            offset = data_start
+            for name, data in sections:
+                typecode = data.typecode if isinstance(data, array.array) else 'B'
+                length = len(data) * (data.itemsize if isinstance(data, array.array) else 1)
+                header['arrays'][name] = [typecode, offset, length]
+                offset += -(-length // 8) * 8
+            head = cls.MAGIC + json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n'
+            start = -(-len(head) // 8) * 8
+            if start == data_start:
+                break
+            data_start = start
         
-        for topic in topics:
-            # Create filename from title
-            filename = self.sanitize_filename(topic['title']) + '.md'
-            filepath = os.path.join(forum_path, filename)
-            
-            # Generate markdown
-            markdown = self.build_forum_topic(topic, unified_id_map, base_url)
-            
-            # Write file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(markdown)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as fh:
+            fh.write(head.ljust(data_start, b' '))
+            for name, data in sections:
+                raw = data.tobytes() if isinstance(data, array.array) else data
+                fh.write(raw)
+                fh.write(b'\0' * (-len(raw) % 8))
+        os.replace(path + '.tmp', path)
+        return header
+
+    def stale_sources(self, ds):
+        """Raw files that changed since the index was built"""
+        stale = []
+        for f, header in self.header['sources'].items():
+            raw_path = os.path.join(ds.raw_archive, ds.conf['local.raw_files'][f])
+            if not os.path.exists(raw_path) or not ds.source_unchanged(header, raw_path, os.stat(raw_path)):
+                stale.append(f)
+        return stale
+
+    def find_term(self, term):
+        """Index of a term in the sorted term table, or None"""
+        key = term.encode('utf-8')
+        offsets, blob = self.arrays['term_offsets'], self.arrays['terms']
+        lo, hi = 0, self.header['terms']
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found = blob[offsets[mid]:offsets[mid + 1]].tobytes()
+            if found < key:
+                lo = mid + 1
+            elif found > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def record(self, doc):
+        """[vault note path, title, date, url] of a document"""
+        offsets = self.arrays['record_offsets']
+        return json.loads(self.arrays['records'][offsets[doc]:offsets[doc + 1]].tobytes())
+
+    def doc_authors(self, doc):
+        offsets = self.arrays['author_offsets']
+        return self.arrays['author_ids'][offsets[doc]:offsets[doc + 1]]
+
+    def search(self, query, sources=None, author=None, since=None, until=None, limit=10):
+        """Rank documents matching any term of query with BM25, returning [(score, doc)]
+
+        sources restricts results to the named raw files, author to
+        documents that person wrote in (case-insensitive) and since/until to
+        dates in that YYYYMMDD range, inclusive.
+        """
+        wanted = None
+        if sources:
+            wanted = {c for c, (f, _) in enumerate(self.header['collections']) if f in sources}
+        author_id = None
+        if author is not None:
+            author_id = self.authors.get(author.lower())
+            if author_id is None:
+                return []
         
-        # Create forum index
-        index_path = os.path.join(self.vault_path, f'{forum_name} Archive.md')
-        self.create_forum_index(topics, forum_name, index_path)
+        doc_length, doc_date, doc_collection = self.arrays['doc_length'], self.arrays['doc_date'], self.arrays['doc_collection']
+        checked = {}
+        def admitted(doc):
+            ok = checked.get(doc)
+            if ok is None:
+                ok = ((wanted is None or doc_collection[doc] in wanted)
+                      and (since is None or doc_date[doc] >= since)
+                      and (until is None or doc_date[doc] <= until)
+                      and (author_id is None or author_id in self.doc_authors(doc)))
+                checked[doc] = ok
+            return ok
         
-        print(f"Created {len(topics)} forum topic files in {forum_path}")
+        n = self.header['docs']
+        average = self.header['average_length'] or 1
+        offsets = self.arrays['posting_offsets']
+        docs, weights = self.arrays['posting_docs'], self.arrays['posting_weights']
+        scores = collections.Counter()
+        for term in SearchIndex.term_counts(query):
+            t = self.find_term(term)
+            if t is None:
+                continue
+            start, end = offsets[t], offsets[t + 1]
+            idf = math.log(1 + (n - (end - start) + 0.5) / ((end - start) + 0.5))
+            for doc, tf in zip(docs[start:end], weights[start:end]):
+                if admitted(doc):
+                    norm = self.K1 * (1 - self.B + self.B * doc_length[doc] / average)
+                    scores[doc] += idf * tf * (self.K1 + 1) / (tf + norm)
+        return [(score, doc) for doc, score in sorted(scores.items(), key=lambda s: (-s[1], s[0]))[:limit]]
 
 
-class DataStore:
-    def __init__(self, conf):
-        self.conf = conf
-        self.root = conf['root']
-        self.raw_archive = os.path.join(self.root, conf['local.storage']['raw'])
-        os.makedirs(self.raw_archive, exist_ok=True)
-
-    def update_archive(self):
-        remote_files = self.conf['remote.raw_files']
-        local_files = self.conf['local.raw_files']
+def search_index_path(ds):
+    return os.path.join(ds.cache_path, 'search.idx')
 
-        for f in remote_files:
-            local = os.path.join(self.raw_archive, local_files[f])
-            download_file(remote_files[f], local)
+def date_bound(value):
+    """Parse a YYYY, YYYY-MM or YYYY-MM-DD date into its numbers"""
+    try:
+        parts = [int(part) for part in value.split('-')]
+    except ValueError:
+        parts = []
+    if not 1 <= len(parts) <= 3:
+        raise argparse.ArgumentTypeError(f"expected YYYY, YYYY-MM or YYYY-MM-DD, got {value}")
+    return parts
 
-    def load_raw_file(self, f):
-        path = os.path.join(self.raw_archive, self.conf['local.raw_files'][f])
-        data = load_json(path)
-        return data
+def date_number(parts, upper):
+    """YYYYMMDD number of the first or, if upper, the last day of a date_bound"""
+    year, month, day = parts + [None] * (3 - len(parts))
+    if month is None:
+        month = 12 if upper else 1
+    if day is None:
+        day = 31 if upper else 1
+    return year * 10000 + month * 100 + day
 
 
 # Instantiate an EntryPoints object
@@ -1322,12 +3735,13 @@ entry = EntryPoints()
 @entry.point
 def update_archive(args):
     conf = load_json(args.conf)
-    DataStore(conf).update_archive()
+    fetcher = RawFileFetcher(timeout=args.timeout, retries=args.retries)
+    make_datastore(conf, args).update_archive(fetcher)
 
 @entry.point
 def dump_item(args):
     conf = load_json(args.conf)
-    ds = DataStore(conf)
+    ds = make_datastore(conf, args)
     data = ds.load_raw_file('blog')
     print(len(data['posts']))
     data = ds.load_raw_file('general_forum')
@@ -1336,16 +3750,128 @@ def dump_item(args):
     print(len(data['topics']))
 
 @entry.point
-def build_vault(args):
-    """Build an Obsidian vault from the archived data"""
+def index_archive(args):
+    """Build the byte-offset index of every raw file"""
     conf = load_json(args.conf)
     ds = DataStore(conf)
-    builder = ObsidianVaultBuilder(conf)
+    for f in conf['local.raw_files']:
+        index = ds.build_index(f)
+        print(f"Indexed {len(index['items'])} items of {f} in {ds.index_path(f)}")
+
+@entry.point
+def build_search_index(args):
+    """Build the on-disk full-text index of the raw archive used by search"""
+    conf = load_json(args.conf)
+    ds = make_datastore(conf, args)
+    path = search_index_path(ds)
+    header = ArchiveSearchIndex.build(ds, path)
+    print(f"Indexed {header['docs']} posts and topics, {header['terms']} terms, in {path} ({os.path.getsize(path) / 1024:0.1f} KB)")
+
+@entry.point
+def search(args):
+    """Search the archive, listing the vault notes of the best matches"""
+    conf = load_json(args.conf)
+    ds = DataStore(conf)
+    path = search_index_path(ds)
+    if not os.path.exists(path):
+        print(f"No search index at {path}; run build_search_index first")
+        return
+    
+    vault_path = os.path.join(conf['root'], conf.get('vault_path', 'vault'))
+    with ArchiveSearchIndex(path) as index:
+        stale = index.stale_sources(ds)
+        if stale:
+            print(f"Warning: {', '.join(stale)} changed since the index was built; run build_search_index")
+        results = index.search(' '.join(args.query), sources=args.collection, author=args.author,
+                               since=date_number(args.since, False) if args.since else None,
+                               until=date_number(args.until, True) if args.until else None,
+                               limit=args.limit)
+        labels = [folder for _, folder in index.header['collections']]
+        for rank, (score, doc) in enumerate(results, 1):
+            note, title, date, url = index.record(doc)
+            if args.shard:
+                day = index.arrays['doc_date'][doc]
+                folder, name = note.split('/', 1)
+                note = f"{folder}/{shard_folder((day // 10000, day // 100 % 100), args.shard)}{name}"
+            print(f"{rank:2d}. [{labels[index.arrays['doc_collection'][doc]]}] {date}  {title}  ({score:0.2f})")
+            print(f"    {os.path.join(vault_path, note)}")
+        if not results:
+            print("No matches")
+
+@entry.point
+def compare_parsers(args):
+    """Check that every body parser gives the reference Markdown on the archived data"""
+    conf = load_json(args.conf)
+    ds = make_datastore(conf, args)
+    data = [ds.load_raw_file(f) for f, _, _, _ in ItemRegistry.COLLECTIONS]
+    for raw_file, (_, key, _, _) in zip(data, ItemRegistry.COLLECTIONS):
+        normalize_items(raw_file, key)
+    unified_id_map = LinkIndex(conf, ItemRegistry(*data).unified_id_map())
+    
+    def markdown(feed, body, base_url):
+        parser = HTML2MarkdownParser(base_url, unified_id_map)
+        feed(parser, body)
+        return parser.get_markdown()
+    
+    bodies = []
+    for raw_file, (_, key, _, _) in zip(data, ItemRegistry.COLLECTIONS):
+        for item in full_items(raw_file, key):
+            bodies.extend((body, item.url) for body in item_bodies(item))
+    
+    tic = Tic()
+    expected = [markdown(HTML2MarkdownParser.feed, body, base_url) for body, base_url in bodies]
+    print(f"reference: {tic.toc():0.05f} seconds for {len(bodies)} bodies")
+    
+    for name, parse in BODY_PARSERS.items():
+        feed = lambda parser, body: parser.feed_nodes(parse(body))
+        tic = Tic()
+        actual = [markdown(feed, body, base_url) for body, base_url in bodies]
+        seconds = tic.toc()
+        differ = [i for i, text in enumerate(actual) if text != expected[i]]
+        print(f"{name}: {seconds:0.05f} seconds, {len(differ)} bodies differ from the reference")
+        for i in differ[:args.show]:
+            print(f"  {bodies[i][1]}: {bodies[i][0][:200]!r}")
+
+@entry.point
+def build_one(args):
+    """Re-render a single post or topic as a vault note and an HTML page"""
+    conf = load_json(args.conf)
+    ds = DataStore(conf)
+    indexes = {f: ds.load_index(f) for f in conf['local.raw_files']}
+    found = ds.find_item(indexes, url=args.url, item_id=args.id)
+    if found is None:
+        print(f"No post or topic found for {args.url or args.id}")
+        return
+    f, entry = found
+    item = Item(ds.load_item(f, entry))
     
-    # Load all data
-    blog_data = ds.load_raw_file('blog')
-    fvp_forum_data = ds.load_raw_file('fvp_forum')
-    general_forum_data = ds.load_raw_file('general_forum')
+    # The link maps only need the url, title and date of every item, which the indexes have
+    stubs = {}
+    for name, index in indexes.items():
+        stubs[name] = {ds.ITEM_KEYS[name]: [Item({'url': e[1], 'title': e[2], 'date': e[5]}) for e in index['items']]}
+    base_url = indexes[f]['items'][0][1]
+    
+    vault = ObsidianVaultBuilder(conf)
+    vault.replies_per_page = args.replies_per_page
+    vault.shard = args.shard
+    unified_id_map = LinkIndex(conf, vault.build_unified_id_map(stubs['blog'], stubs['fvp_forum'], stubs['general_forum']))
+    print(f"Wrote {vault.build_single_item(f, item, unified_id_map, base_url)}")
+    
+    site = HTMLSiteBuilder(conf)
+    site.replies_per_page = args.replies_per_page
+    site.lazy_comments = args.lazy_comments
+    site.search_enabled = not args.no_search
+    site.shard = args.shard
+    site.create_assets()
+    unified_url_map = LinkIndex(conf, site.build_unified_url_map(stubs['blog'], stubs['fvp_forum'], stubs['general_forum']))
+    print(f"Wrote {site.build_single_item(f, item, unified_url_map, base_url)}")
+
+def load_archive(ds, args):
+    """Load the blog and both forums, applying --stream and --max_posts"""
+    load = ds.stream_raw_file if args.stream else ds.load_raw_file
+    blog_data = load('blog')
+    fvp_forum_data = load('fvp_forum')
+    general_forum_data = load('general_forum')
     
     # Apply max_posts limit if specified
     if args.max_posts is not None:
@@ -1353,72 +3879,258 @@ def build_vault(args):
         fvp_forum_data['topics'] = fvp_forum_data['topics'][:args.max_posts]
         general_forum_data['topics'] = general_forum_data['topics'][:args.max_posts]
     
+    normalize_items(blog_data, 'posts')
+    normalize_items(fvp_forum_data, 'topics')
+    normalize_items(general_forum_data, 'topics')
+    return blog_data, fvp_forum_data, general_forum_data
+
+def check_output_format(args):
+    """Exit with a usage error, as argparse does, on options that can't go together"""
+    if args.incremental and args.output_format != 'dir':
+        print(f"{os.path.basename(sys.argv[0])}: error: --incremental only applies to --output_format dir; archives are always built in full", file=sys.stderr)
+        sys.exit(2)
+
+def vault_from_data(conf, args, blog_data, fvp_forum_data, general_forum_data, unified_id_map=None, body_cache=None, views=None, make_writer=None):
+    """Build the Obsidian vault from loaded data, returning the writer it was written through
+
+    make_writer is called with the vault's path for the writer; by default
+    the vault goes where --output_format says.
+    """
+    if make_writer is None:
+        check_output_format(args)
+        make_writer = functools.partial(output_writer, args.output_format)
+    builder = ObsidianVaultBuilder(conf)
+    builder.writer = make_writer(builder.vault_path)
+    builder.body_cache = body_cache
+    builder.body_parser = BODY_PARSERS[args.parser]
+    builder.replies_per_page = args.replies_per_page
+    builder.shard = args.shard
+    if builder.writer.in_place:
+        builder.manifest = BuildManifest(builder.vault_path, incremental=args.incremental,
+                                         settings={'replies_per_page': args.replies_per_page, 'shard': args.shard})
+    jobs = resolve_jobs(args.jobs)
+    builder.writer.start(args.write_threads)
+    
     # Build unified ID map across all content
-    unified_id_map = builder.build_unified_id_map(blog_data, fvp_forum_data, general_forum_data)
+    if unified_id_map is None:
+        unified_id_map = builder.build_unified_id_map(blog_data, fvp_forum_data, general_forum_data)
+    unified_id_map = LinkIndex(conf, unified_id_map)
+    if views is None:
+        views = collection_views(blog_data, fvp_forum_data, general_forum_data)
     
     # Build blog with unified map
-    builder.build_blog_vault(blog_data, unified_id_map)
+    builder.build_blog_vault(blog_data, unified_id_map, jobs, views['blog'])
     
     # Build FVP Forum with unified map
-    fvp_base_url = fvp_forum_data['topics'][0]['url'] if fvp_forum_data['topics'] else 'http://markforster.squarespace.com'
-    builder.build_forum_vault(fvp_forum_data, 'FVP Forum', builder.fvp_forum_path, fvp_base_url, unified_id_map)
+    fvp_base_url = fvp_forum_data['topics'][0].url if fvp_forum_data['topics'] else 'http://markforster.squarespace.com'
+    builder.build_forum_vault(fvp_forum_data, 'FVP Forum', builder.fvp_forum_path, fvp_base_url, unified_id_map, jobs, views['fvp_forum'])
     
     # Build General Forum with unified map
-    general_base_url = general_forum_data['topics'][0]['url'] if general_forum_data['topics'] else 'http://markforster.squarespace.com'
-    builder.build_forum_vault(general_forum_data, 'General Forum', builder.general_forum_path, general_base_url, unified_id_map)
+    general_base_url = general_forum_data['topics'][0].url if general_forum_data['topics'] else 'http://markforster.squarespace.com'
+    builder.build_forum_vault(general_forum_data, 'General Forum', builder.general_forum_path, general_base_url, unified_id_map, jobs, views['general_forum'])
     
-    print(f"Vault created at: {builder.vault_path}")
+    builder.writer.close()
+    if builder.manifest is not None:
+        builder.manifest.save(builder.writer)
+    print(builder.writer.report())
+    print(f"Vault created at: {builder.writer.destination(builder.vault_path)}")
+    return builder.writer
 
-@entry.point
-def build_html(args):
-    """Build a standalone HTML site from the archived data"""
-    conf = load_json(args.conf)
-    ds = DataStore(conf)
+def html_from_data(conf, args, blog_data, fvp_forum_data, general_forum_data, unified_url_map=None, views=None, make_writer=None):
+    """Build the HTML site from loaded data, returning the writer it was written through
+
+    make_writer is called with the site's path for the writer; by default
+    the site goes where --output_format says.
+    """
+    if make_writer is None:
+        check_output_format(args)
+        make_writer = functools.partial(output_writer, args.output_format)
     builder = HTMLSiteBuilder(conf)
-    
-    # Load all data
-    blog_data = ds.load_raw_file('blog')
-    fvp_forum_data = ds.load_raw_file('fvp_forum')
-    general_forum_data = ds.load_raw_file('general_forum')
-    
-    # Apply max_posts limit if specified
-    if args.max_posts is not None:
-        blog_data['posts'] = blog_data['posts'][:args.max_posts]
-        fvp_forum_data['topics'] = fvp_forum_data['topics'][:args.max_posts]
-        general_forum_data['topics'] = general_forum_data['topics'][:args.max_posts]
+    builder.writer = make_writer(builder.html_path)
+    builder.create_assets()
+    builder.replies_per_page = args.replies_per_page
+    builder.lazy_comments = args.lazy_comments
+    builder.shard = args.shard
+    builder.search_enabled = not args.no_search
+    if builder.search_enabled:
+        # Saved term weights are only kept for a site on disk, next to its manifest
+        builder.search_index = SearchIndex(os.path.normpath(builder.html_path) + '.search.cache' if builder.writer.in_place else None)
+    if builder.writer.in_place:
+        builder.manifest = BuildManifest(builder.html_path, incremental=args.incremental,
+                                         settings={'replies_per_page': args.replies_per_page, 'lazy_comments': args.lazy_comments,
+                                                   'search': not args.no_search, 'shard': args.shard})
+    builder.page_size = args.page_size
+    jobs = resolve_jobs(args.jobs)
+    builder.writer.start(args.write_threads)
     
     # Build unified URL map across all content
-    unified_url_map = builder.build_unified_url_map(blog_data, fvp_forum_data, general_forum_data)
+    if unified_url_map is None:
+        unified_url_map = builder.build_unified_url_map(blog_data, fvp_forum_data, general_forum_data)
+    unified_url_map = LinkIndex(conf, unified_url_map)
+    if views is None:
+        views = collection_views(blog_data, fvp_forum_data, general_forum_data)
     
     # Build blog
-    builder.build_blog_html(blog_data, unified_url_map)
+    builder.build_blog_html(blog_data, unified_url_map, jobs)
     
     # Build forums
-    fvp_base_url = fvp_forum_data['topics'][0]['url'] if fvp_forum_data['topics'] else 'http://markforster.squarespace.com'
-    builder.build_forum_html(fvp_forum_data, 'fvp_forum', 'FVP Forum', fvp_base_url, unified_url_map)
+    fvp_base_url = fvp_forum_data['topics'][0].url if fvp_forum_data['topics'] else 'http://markforster.squarespace.com'
+    builder.build_forum_html(fvp_forum_data, 'fvp_forum', 'FVP Forum', fvp_base_url, unified_url_map, jobs)
     
-    general_base_url = general_forum_data['topics'][0]['url'] if general_forum_data['topics'] else 'http://markforster.squarespace.com'
-    builder.build_forum_html(general_forum_data, 'general_forum', 'General Forum', general_base_url, unified_url_map)
+    general_base_url = general_forum_data['topics'][0].url if general_forum_data['topics'] else 'http://markforster.squarespace.com'
+    builder.build_forum_html(general_forum_data, 'general_forum', 'General Forum', general_base_url, unified_url_map, jobs)
     
     # Build index pages
-    builder.build_blog_index_html(blog_data)
-    builder.build_forum_index_html(fvp_forum_data, 'fvp_forum', 'FVP Forum')
-    builder.build_forum_index_html(general_forum_data, 'general_forum', 'General Forum')
-    builder.build_main_index_html(blog_data, fvp_forum_data, general_forum_data)
+    builder.build_blog_index_html(views['blog'])
+    builder.build_forum_index_html(views['fvp_forum'], 'fvp_forum', 'FVP Forum')
+    builder.build_forum_index_html(views['general_forum'], 'general_forum', 'General Forum')
+    builder.build_main_index_html(views)
+    if builder.search_index is not None:
+        builder.build_search_html({'blog': 'Blog', 'fvp_forum': 'FVP Forum', 'general_forum': 'General Forum'})
+    
+    builder.writer.close()
+    if builder.manifest is not None:
+        builder.manifest.save(builder.writer)
+    if builder.search_index is not None:
+        builder.search_index.save()
+    report = builder.link_report
+    print(f"Rewrote {report['rewritten']} internal links, left {report['untouched']} links unchanged")
+    print(builder.writer.report())
+    print(f"HTML site created at: {builder.writer.destination(builder.html_path)}")
+    return builder.writer
+
+@entry.point
+def build_vault(args):
+    """Build an Obsidian vault from the archived data"""
+    check_output_format(args)
+    conf = load_json(args.conf)
+    ds = make_datastore(conf, args)
+    body_cache = make_body_cache(ds, args)
+    vault_from_data(conf, args, *load_archive(ds, args), body_cache=body_cache)
+    if body_cache is not None:
+        body_cache.save()
+
+@entry.point
+def build_html(args):
+    """Build a standalone HTML site from the archived data"""
+    check_output_format(args)
+    conf = load_json(args.conf)
+    ds = make_datastore(conf, args)
+    html_from_data(conf, args, *load_archive(ds, args))
+
+@entry.point
+def build_all(args):
+    """Build the vault and the HTML site concurrently from a single load of the data"""
+    check_output_format(args)
+    conf = load_json(args.conf)
+    ds = make_datastore(conf, args)
+    
+    tic = Tic()
+    data = load_archive(ds, args)
+    registry = ItemRegistry(*data, shard=args.shard)
+    views = collection_views(*data)
+    timings = {'load': tic.toc()}
+    
+    body_cache = make_body_cache(ds, args)
+    
+    def timed(name, build, *build_args):
+        tic = Tic()
+        build(conf, args, *data, *build_args)
+        timings[name] = tic.toc()
+    
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [
+            pool.submit(timed, 'vault', vault_from_data, registry.unified_id_map(), body_cache, views),
+            pool.submit(timed, 'html', html_from_data, registry.unified_url_map(), views),
+        ]
+        for future in futures:
+            future.result()
     
-    print(f"HTML site created at: {builder.html_path}")
+    if body_cache is not None:
+        body_cache.save()
+    
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds:0.05f} seconds")
+
+def positive_int(value):
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value}")
+    return n
+
+def non_negative_int(value):
+    n = int(value)
+    if n < 0:
+        raise argparse.ArgumentTypeError(f"expected a non-negative integer, got {value}")
+    return n
+
+@search.parser
+def search_parser(parser):
+    parser.add_argument("query", nargs='+')
+    parser.add_argument("--collection", action="append", choices=[f for f, _, _, _ in ItemRegistry.COLLECTIONS], help="only search this raw file (repeatable)")
+    parser.add_argument("--author", help="only posts and topics this person wrote in")
+    parser.add_argument("--since", type=date_bound, help="earliest date, YYYY[-MM[-DD]]")
+    parser.add_argument("--until", type=date_bound, help="latest date, YYYY[-MM[-DD]]")
+    parser.add_argument("--limit", default=10, type=positive_int)
+    parser.add_argument("--shard", choices=sorted(SHARD_LAYOUTS), default=None, help="the --shard layout the vault was built with")
+
+@compare_parsers.parser
+def compare_parsers_parser(parser):
+    parser.add_argument("--show", default=5, type=int, help="number of differing bodies to print per parser")
+
+@build_one.parser
+def build_one_parser(parser):
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--url")
+    group.add_argument("--id")
+    parser.add_argument("--lazy_comments", default=None, type=non_negative_int, metavar="N", help="show only the first N comments or replies of a page and load the rest on demand")
+    parser.add_argument("--replies_per_page", default=100, type=positive_int, help="split forum topics with more posts than this into pages")
+    parser.add_argument("--no_search", action="store_true", help="match a site built without the search page")
+    parser.add_argument("--shard", choices=sorted(SHARD_LAYOUTS), default=None, help="match a build that put posts and topics in year or year/month subfolders")
+
+@update_archive.parser
+def update_archive_parser(parser):
+    parser.add_argument("--timeout", default=60, type=float, help="per-request timeout in seconds")
+    parser.add_argument("--retries", default=3, type=int)
 
 @build_html.parser
 def build_html_parser(parser):
     parser.add_argument("--max_posts", default=None, type=int)
+    parser.add_argument("--jobs", default=1, type=int, help="worker processes for rendering (0 = one per CPU core)")
+    parser.add_argument("--incremental", action="store_true", help="only re-render items that changed since the last build")
+    parser.add_argument("--stream", action="store_true", help="stream items from the raw files to keep memory use bounded")
+    parser.add_argument("--page_size", default=100, type=positive_int, help="entries per page of the HTML blog and forum indexes")
+    parser.add_argument("--lazy_comments", default=None, type=non_negative_int, metavar="N", help="show only the first N comments or replies of a page and load the rest on demand")
+    parser.add_argument("--replies_per_page", default=100, type=positive_int, help="split forum topics with more posts than this into pages")
+    parser.add_argument("--no_search", action="store_true", help="don't build the search index and search page")
+    parser.add_argument("--write_threads", default=4, type=non_negative_int, help="background threads writing output files (0 = write in the rendering loop)")
+    parser.add_argument("--output_format", choices=['dir', *ArchiveWriter.FORMATS], default='dir', help="write the output as a directory or straight into an archive next to where it would be")
+    parser.add_argument("--shard", choices=sorted(SHARD_LAYOUTS), default=None, help="put posts and topics in year or year/month subfolders")
 
 @build_vault.parser
 def build_vault_parser(parser):
     parser.add_argument("--max_posts", default=None, type=int)
+    parser.add_argument("--jobs", default=1, type=int, help="worker processes for rendering (0 = one per CPU core)")
+    parser.add_argument("--incremental", action="store_true", help="only re-render items that changed since the last build")
+    parser.add_argument("--stream", action="store_true", help="stream items from the raw files to keep memory use bounded")
+    parser.add_argument("--parser", choices=sorted(BODY_PARSERS), default='tokenizer', help="how HTML bodies are parsed (htmlparser is the reference)")
+    parser.add_argument("--replies_per_page", default=100, type=positive_int, help="split forum topics with more posts than this into pages")
+    parser.add_argument("--write_threads", default=4, type=non_negative_int, help="background threads writing output files (0 = write in the rendering loop)")
+    parser.add_argument("--output_format", choices=['dir', *ArchiveWriter.FORMATS], default='dir', help="write the output as a directory or straight into an archive next to where it would be")
+    parser.add_argument("--shard", choices=sorted(SHARD_LAYOUTS), default=None, help="put posts and topics in year or year/month subfolders")
+
+@build_all.parser
+def build_all_parser(parser):
+    build_vault_parser(parser)
+    parser.add_argument("--page_size", default=100, type=positive_int, help="entries per page of the HTML blog and forum indexes")
+    parser.add_argument("--lazy_comments", default=None, type=non_negative_int, metavar="N", help="show only the first N comments or replies of a page and load the rest on demand")
+    parser.add_argument("--no_search", action="store_true", help="don't build the search index and search page")
 
 @entry.add_common_parser
 def common_settings(parser):
     parser.add_argument("--conf", default='conf.json')
+    parser.add_argument("--no_cache", action="store_true", help="always parse the raw JSON files instead of using the parsed-file cache")
+    parser.add_argument("--backend", choices=['json', 'sqlite'], default='json', help="where builds read the archive from")
 
 
 
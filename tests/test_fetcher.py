@@ -0,0 +1,123 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from build_archive import RawFileFetcher
+
+
+BODY = bytes(range(256)) * 1200
+ETAG = '"v1"'
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """Serves BODY with an ETag, honouring If-None-Match and Range like the archive host"""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if self.path != '/blog.json':
+            self.send_error(404)
+            return
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and not server.ignore_range and self.headers.get('If-Range') == ETAG:
+            start = int(range_header.removeprefix('bytes=').rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(BODY) - 1}/{len(BODY)}')
+        else:
+            self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(BODY) - start))
+        self.end_headers()
+
+        if server.truncate_at is not None:
+            # Drop the connection part way through the body, once
+            self.wfile.write(BODY[start:server.truncate_at])
+            server.truncate_at = None
+            self.close_connection = True
+            return
+        self.wfile.write(BODY[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ArchiveHandler)
+        self.server.requests = []
+        self.server.truncate_at = None
+        self.server.ignore_range = False
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.out_file = os.path.join(tmp.name, 'blog.json')
+        self.url = f'http://127.0.0.1:{self.server.server_port}/blog.json'
+        self.fetcher = RawFileFetcher(timeout=5, retries=2, backoff=0)
+
+    def read_output(self):
+        with open(self.out_file, 'rb') as f:
+            return f.read()
+
+    def test_download_then_not_modified(self):
+        summary = self.fetcher.fetch(self.url, self.out_file)
+        self.assertTrue(summary['modified'])
+        self.assertEqual(summary['validators']['etag'], ETAG)
+        self.assertEqual(summary['bytes'], len(BODY))
+        self.assertEqual(self.read_output(), BODY)
+
+        summary = self.fetcher.fetch(self.url, self.out_file, summary['validators'])
+        self.assertFalse(summary['modified'])
+        self.assertEqual(self.server.requests[-1].get('If-None-Match'), ETAG)
+        self.assertEqual(self.read_output(), BODY)
+
+    def test_replaces_the_file_atomically(self):
+        with open(self.out_file, 'wb') as f:
+            f.write(b'old')
+        self.fetcher.fetch(self.url, self.out_file)
+        self.assertEqual(self.read_output(), BODY)
+        self.assertFalse(os.path.exists(self.out_file + '.part'))
+
+        # A failed download leaves the previous file alone
+        with self.assertRaises(Exception):
+            self.fetcher.fetch(self.url.replace('blog.json', 'missing.json'), self.out_file)
+        self.assertEqual(self.read_output(), BODY)
+        self.assertFalse(os.path.exists(self.out_file + '.part'))
+
+    def test_resumes_a_truncated_body(self):
+        self.server.truncate_at = 100000
+        summary = self.fetcher.fetch(self.url, self.out_file)
+        self.assertEqual(self.read_output(), BODY)
+        self.assertEqual(summary['bytes'], len(BODY))
+        self.assertEqual(len(self.server.requests), 2)
+        # The resume starts after the last complete chunk that was received
+        offset = int(self.server.requests[1]['Range'].removeprefix('bytes=').rstrip('-'))
+        self.assertTrue(0 < offset <= 100000)
+        self.assertEqual(self.server.requests[1].get('If-Range'), ETAG)
+        self.assertFalse(os.path.exists(self.out_file + '.part'))
+
+    def test_restarts_when_the_range_is_ignored(self):
+        self.server.truncate_at = 100000
+        self.server.ignore_range = True
+        summary = self.fetcher.fetch(self.url, self.out_file)
+        self.assertEqual(self.read_output(), BODY)
+        self.assertEqual(summary['bytes'], len(BODY))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import random
+import sys
+import unittest
+from html.parser import HTMLParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from build_archive import rewrite_links
+
+
+URL_MAP = {
+    'http://markforster.net/x': '../blog/X &lt;1&gt;.html',
+    'http://markforster.net/y?a=1&b=2': "../blog/it's.html",
+}
+
+# Fragments random bodies are made of: anchors written every way HTMLParser
+# accepts them, lookalikes inside attributes and comments, script and style
+# elements, and stray markup characters
+PIECES = [
+    '<a href="http://markforster.net/x">', '<a href=http://markforster.net/x>',
+    "<a href='http://markforster.net/y?a=1&amp;b=2'>", '</a>', 'text ', "it's ",
+    '<img alt="<a href=http://markforster.net/x>">', '<script>', '</script>', '<style>', '</style>',
+    '<a title=it\'s href="http://markforster.net/x">', '<!-- <a href="http://markforster.net/x"> -->',
+    '<', '>', '"', "'", '1 < 2 ',
+    '<A HREF="http://markforster.net/x" href="http://markforster.net/y?a=1&amp;b=2">',
+    '<a href="http://markforster.net/x" href="">', '<a href="" href="http://markforster.net/x">',
+    '<a href="other">', '<p class="c">', '<br/>', '<a\nhref="http://markforster.net/x"\n>',
+    '<a href="http://markforster.net/x"/>', '<a href>', '<b>', '&amp;', '<div x=\'"\'>',
+]
+
+
+class Hrefs(HTMLParser):
+    """The href of every anchor as HTMLParser reads it: the last one, None if empty"""
+
+    def __init__(self):
+        super().__init__()
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            values = [value for name, value in attrs if name == 'href']
+            self.hrefs.append(values[-1] if values and values[-1] else None)
+
+    handle_startendtag = handle_starttag
+
+
+def hrefs(html):
+    parser = Hrefs()
+    parser.feed(html)
+    parser.close()
+    return parser.hrefs
+
+
+class RewriteLinksTest(unittest.TestCase):
+    """rewrite_links must change exactly the hrefs HTMLParser sees"""
+
+    def check(self, html):
+        expected = [None if href is None else URL_MAP.get(href, href) for href in hrefs(html)]
+        output, _, _ = rewrite_links(html, URL_MAP)
+        self.assertEqual(hrefs(output), expected, html)
+
+    def test_last_href_wins(self):
+        for prefix in ('', '1 < 2 ', '<script></script>'):
+            html = prefix + '<a href="http://markforster.net/x" href="">t</a>'
+            self.assertEqual(rewrite_links(html, URL_MAP), (html, [], []))
+            html = prefix + '<a href="" href="http://markforster.net/x">t</a>'
+            self.assertEqual(rewrite_links(html, URL_MAP)[1], ['http://markforster.net/x'])
+
+    def test_random_bodies(self):
+        rng = random.Random(1)
+        for _ in range(100000):
+            self.check(''.join(rng.choice(PIECES) for _ in range(rng.randint(1, 12))))
+
+
+if __name__ == '__main__':
+    unittest.main()
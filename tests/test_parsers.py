@@ -0,0 +1,95 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from build_archive import BODY_PARSERS, HTML2MarkdownParser, parse_body, tokenize_body
+
+
+BASE_URL = 'http://markforster.squarespace.com/blog/2010/1/1/post.html'
+ID_MAP = {
+    'http://markforster.squarespace.com/blog/2010/2/2/other.html': 'Blog/Other Post',
+    'http://markforster.squarespace.com/forum/post/5000': 'General Forum/A Topic',
+}
+
+# Bodies on which the tokenizer's shortcuts are most likely to go wrong
+CORPUS = [
+    '',
+    'plain text',
+    '<p>A <strong>bold</strong> and <em>slanted</em> paragraph.</p>',
+    '<p>1 < 2 and 3 > 2</p>',
+    'a stray < at the end <',
+    '<<p>>double<</p>>',
+    '<br/>line<br />break<hr/>',
+    '<img src="x.png" alt="an image"/>',
+    '<a href="/blog/2010/2/2/other.html"/>self-closed link',
+    'fish &amp; chips &lt;tag&gt; &nbsp;&copy;',
+    'a partial entity at the end &am',
+    'a bare ampersand & and &#',
+    '&#65;&#x42; numeric references &#12',
+    'semicolonless &amp entity',
+    '<script>if (a < b && c > d) { document.write("<p>x</p>"); }</script>after',
+    '<style>p > a { color: red; }</style><p>styled</p>',
+    '<SCRIPT type="text/javascript">var s = "</scr" + "ipt>";</SCRIPT>',
+    '<!-- a comment with <a href="/x">a link</a> -->text',
+    '<!-- unterminated comment',
+    '<!DOCTYPE html><p>doctype</p>',
+    '<![CDATA[ <p>not a tag</p> ]]>',
+    '<?xml version="1.0"?>processing instruction',
+    '<a href=/blog/2010/2/2/other.html>unquoted</a>',
+    '<a href=http://markforster.squarespace.com/forum/post/5000 title=topic>unquoted absolute</a>',
+    '<a href="/x" href="/blog/2010/2/2/other.html">duplicate href</a>',
+    '<a href="/blog/2010/2/2/other.html" href="">duplicate, last empty</a>',
+    '<a title=\'it"s\' href=\'/blog/2010/2/2/other.html\'>single quotes</a>',
+    '<a\nhref="/blog/2010/2/2/other.html"\n>newlines in the tag</a>',
+    '<A HREF="/blog/2010/2/2/other.html">UPPER CASE</A>',
+    '<a href>no value</a><a>no href</a>',
+    '<p class="c" id=x data-x>attributes without values</p>',
+    '<div x=\'"\'>quote in a value</div>',
+    '<ul><li>one</li><li>two<ol><li>nested</li></ol></li></ul>',
+    '<blockquote><p>quoted</p></blockquote>',
+    '<pre><code>x < y &amp;&amp; z</code></pre>',
+    '<h1>Title</h1><h3>Sub</h3>',
+    '</p>end tag first',
+    '<p>unclosed <b>tags',
+    '<p/>empty<p></p>',
+    '<table><tr><td>cell</td></tr></table>',
+    '<a href="/blog/2010/2/2/other.html?a=1&amp;b=2#frag">query &amp; fragment</a>',
+    '<p>caf\xe9 – \U0001f600</p>',
+]
+
+
+def markdown(nodes=None, html=None):
+    parser = HTML2MarkdownParser(BASE_URL, ID_MAP)
+    if nodes is None:
+        parser.feed(html)
+    else:
+        parser.feed_nodes(nodes)
+    return parser.get_markdown()
+
+
+class ParserTest(unittest.TestCase):
+    """Every registered body parser must agree with the reference parser"""
+
+    def test_tokenizer_gives_the_reference_nodes(self):
+        for html in CORPUS:
+            with self.subTest(html=html):
+                self.assertEqual(tokenize_body(html), parse_body(html))
+
+    def test_parsers_give_the_reference_markdown(self):
+        for name, parse in BODY_PARSERS.items():
+            for html in CORPUS:
+                with self.subTest(parser=name, html=html):
+                    self.assertEqual(markdown(nodes=parse(html)), markdown(html=html))
+
+    def test_bodies_split_across_corpus_entries(self):
+        # Concatenations put each edge case next to markup it does not expect
+        for first, second in zip(CORPUS, CORPUS[1:] + CORPUS[:1]):
+            html = first + second
+            with self.subTest(html=html):
+                self.assertEqual(tokenize_body(html), parse_body(html))
+
+
+if __name__ == '__main__':
+    unittest.main()
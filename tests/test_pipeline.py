@@ -0,0 +1,75 @@
+import copy
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from build_archive import ArchivePipeline, MemoryWriter
+
+
+ROOT = 'http://markforster.squarespace.com'
+
+
+def date(year, month, day):
+    return {'year': str(year), 'month': str(month), 'day': str(day), 'time': '10:00'}
+
+
+def archive():
+    """A blog post linking to a topic, and a forum topic long enough to be paged"""
+    blog = {'posts': [{
+        'id': 'b1', 'title': 'Final Version', 'date': date(2009, 3, 4), 'url': f'{ROOT}/blog/2009/3/4/final-version.html',
+        'author': 'Mark Forster', 'tags': ['Final Version'],
+        'body': f'<p>See <a href="{ROOT}/forum/post/5000">the discussion</a> &amp; more.</p>',
+        'comments': [{'author': 'Alan', 'date': date(2009, 3, 5), 'body': '<p>Thanks</p>'}],
+    }]}
+    fvp_forum = {'topics': []}
+    general_forum = {'topics': [{
+        'id': 'g1', 'title': 'Using FV', 'date': date(2010, 1, 2), 'url': f'{ROOT}/forum/post/5000',
+        'author': 'Seraphim', 'tags': [],
+        'posts': [{'author': 'Seraphim', 'date': date(2010, 1, 2 + n), 'body': f'<p>Reply {n}</p>'} for n in range(5)],
+    }]}
+    return blog, fvp_forum, general_forum
+
+
+class ArchivePipelineTest(unittest.TestCase):
+    """Builds rendered through a MemoryWriter, without touching the filesystem"""
+
+    def setUp(self):
+        self.root = os.path.join(tempfile.mkdtemp(), 'data')
+        self.conf = {'root': self.root, 'vault_path': 'vault', 'source': {'canonical_root': ROOT}}
+        self.data = archive()
+        self.pipeline = ArchivePipeline(self.conf, *copy.deepcopy(self.data), replies_per_page=2)
+
+    def test_leaves_the_callers_data_alone(self):
+        data = archive()
+        ArchivePipeline(self.conf, *data)
+        self.assertEqual(data, self.data)
+
+    def test_vault_in_memory(self):
+        writer = self.pipeline.build_vault()
+        self.assertIsInstance(writer, MemoryWriter)
+        note = writer.files['Blog/Final Version.md']
+        self.assertIn('[[General Forum/Using FV|the discussion]]', note)
+        self.assertIn('General Forum/Using FV - Page 3.md', list(writer.files))
+        self.assertIn('[[General Forum/Using FV - Page 2|Next →]]', writer.files['General Forum/Using FV.md'])
+        self.assertFalse(os.path.exists(self.root))
+
+    def test_html_in_memory(self):
+        writer = self.pipeline.build_html()
+        page = writer.files['blog/Final Version.html']
+        self.assertIn('href="../general_forum/Using FV.html"', page)
+        self.assertIn('general_forum/Using FV - Page 2.html', list(writer.files))
+        self.assertIn('index.html', list(writer.files))
+        self.assertTrue(any(path.startswith('search/') for path in writer.files))
+        self.assertFalse(os.path.exists(self.root))
+
+    def test_sharded_paths(self):
+        pipeline = ArchivePipeline(self.conf, *archive(), shard='month')
+        self.assertIn('Blog/2009/03/Final Version.md', list(pipeline.build_vault().files))
+        self.assertIn('blog/2009/03/Final Version.html', list(pipeline.build_html().files))
+
+
+if __name__ == '__main__':
+    unittest.main()